@@ -1,63 +1,206 @@
 from tokenize import Double
-from typing import List
+from typing import Dict, List, NamedTuple, Tuple
 from dataclasses import dataclass
+from array import array
+import heapq
+import numpy as np
 
 @dataclass
-class Order(object):   
-    CreatorID: int   
+class Order(object):
+    __slots__ = ("CreatorID", "Side", "Quantity", "Price", "currency")
+    CreatorID: int
     Side: bool # true = offer, false = bid
-    Quantity: int   
+    Quantity: int
     Price: int
     currency: int # 0 = euros, 1 = dollars
 
-@dataclass  
-class Match(object):   
-    Bid: Order   
+@dataclass
+class Match(object):
+    __slots__ = ("Bid", "Offer")
+    Bid: Order
     Offer: Order
 
+class MatchBatch(NamedTuple):
+    """Columns of a batch of matches. buyers and sellers are creator codes, see CDA.creators."""
+    buyers: np.ndarray
+    sellers: np.ndarray
+    quantity: np.ndarray
+    bid_price: np.ndarray
+    offer_price: np.ndarray
+    currency: np.ndarray
+
+class OrderStore:
+    """Resting orders held column-wise in typed arrays and addressed by integer handle.
+
+    Filled orders return their handle to a free list, so a long run reuses the
+    same slots instead of allocating an object per order.
+    """
+    def __init__(self):
+        self.creator = array("q")
+        self.side = array("b")
+        self.quantity = array("q")
+        self.price = array("d")
+        self.currency = array("b")
+        self.free: List[int] = []
+
+    def __len__(self):
+        return len(self.quantity) - len(self.free)
+
+    def allocate(self, creator, side, quantity, price, currency) -> int:
+        if self.free:
+            handle = self.free.pop()
+            self.creator[handle] = creator
+            self.side[handle] = side
+            self.quantity[handle] = quantity
+            self.price[handle] = price
+            self.currency[handle] = currency
+            return handle
+        self.creator.append(creator)
+        self.side.append(side)
+        self.quantity.append(quantity)
+        self.price.append(price)
+        self.currency.append(currency)
+        return len(self.quantity) - 1
+
+    def release(self, handle):
+        self.quantity[handle] = 0
+        self.free.append(handle)
+
 class CDA:
+    """Continuous double auction with a persistent price-time priority book.
+
+    Each currency has its own pair of heaps of (key, arrival, handle) entries.
+    Bids are keyed on -price and offers on price, so the best order on either
+    side is always at index 0. Orders that don't cross stay resting in the book
+    between steps. Order fields live in an OrderStore and matches are appended
+    to typed columns, so matching allocates no per-order objects.
+    """
     def __init__(self):
-        self.bids: List[Order] = []
-        self.offers: List[Order] = []
-        self.matches: List[Match] = []
+        self.books: Dict[int, Tuple[list, list]] = {}
+        self.store = OrderStore()
+        self.creators: List[object] = [] # creator code -> CreatorID
+        self.creator_codes: Dict[object, int] = {}
+        self.sequence = 0 # arrival counter for time priority
+        self.clear_matches()
+        # totals of the last batch handed out by consume_matches
+        self.last_clearing_price = 0.0
+        self.last_matched_quantity = 0
+        self.last_match_count = 0
+
+    def clear_matches(self):
+        self.match_buyers = array("q")
+        self.match_sellers = array("q")
+        self.match_quantity = array("q")
+        self.match_bid_price = array("d")
+        self.match_offer_price = array("d")
+        self.match_currency = array("b")
+        # running quantity-weighted sums over the outstanding matches
+        self.matched_value = 0.0
+        self.matched_quantity = 0
+
+    def get_book(self, currency):
+        book = self.books.get(currency)
+        if book is None:
+            book = self.books[currency] = ([], [])
+        return book
+
+    def creator_code(self, creator_id) -> int:
+        code = self.creator_codes.get(creator_id)
+        if code is None:
+            code = self.creator_codes[creator_id] = len(self.creators)
+            self.creators.append(creator_id)
+        return code
+
+    def order(self, handle) -> Order:
+        store = self.store
+        return Order(self.creators[store.creator[handle]], bool(store.side[handle]), store.quantity[handle], store.price[handle], store.currency[handle])
+
+    @property
+    def bids(self) -> List[Order]:
+        return [self.order(entry[2]) for book in self.books.values() for entry in sorted(book[0])]
+
+    @property
+    def offers(self) -> List[Order]:
+        return [self.order(entry[2]) for book in self.books.values() for entry in sorted(book[1])]
+
+    @property
+    def depth(self) -> int:
+        return len(self.store)
 
     def add_order(self, order: Order):
-        if order.Side:
-            self.offers.append(order)
+        return self.submit(order.CreatorID, order.Side, order.Quantity, order.Price, order.currency)
+
+    def submit(self, creator_id, side, quantity, price, currency):
+        """Adds an order without building an Order object and returns its handle, or None if it is empty."""
+        if quantity <= 0:
+            return None
+        bids, offers = self.get_book(currency)
+        handle = self.store.allocate(self.creator_code(creator_id), side, quantity, price, currency)
+        self.sequence += 1
+        if side:
+            heapq.heappush(offers, (price, self.sequence, handle))
         else:
-            self.bids.append(order)
+            heapq.heappush(bids, (-price, self.sequence, handle))
+        return handle
 
-    # match opposing currencies 
+    # match opposing sides of each currency book, best price first then oldest first
     def match_orders(self):
-        self.bids = sorted(self.bids, key=lambda x: x.Price)[::-1]
-        self.offers = sorted(self.offers, key=lambda x: x.Price)
-
-        while (len(self.bids) > 0 and len(self.offers) > 0):
-            if self.bids[0].Price < self.offers[0].Price:
-                break
-            curr_bid = self.bids.pop()
-            curr_offer = self.offers.pop()
-            if curr_bid.Quantity > curr_offer.Quantity:
-                new_bid = Order(curr_bid.CreatorID, curr_bid.Side, curr_bid.Quantity - curr_offer.Quantity, curr_bid.Price, curr_bid.currency)
-                self.bids.insert(0, new_bid)
-                curr_bid.Quantity = curr_offer.Quantity
-            if curr_bid.Quantity < curr_offer.Quantity:
-                new_offer = Order(curr_offer.CreatorID, curr_offer.Side, curr_offer.Quantity - curr_bid.Quantity, curr_offer.Price, curr_offer.currency)
-                self.offers.insert(0, new_offer)
-                curr_offer.Quantity = curr_bid.Quantity
-            if curr_bid.currency == curr_offer.currency:
-                if curr_bid.CreatorID != curr_offer.CreatorID:
-                    self.matches.append(Match(curr_bid, curr_offer))
+        store = self.store
+        creator, quantities, prices = store.creator, store.quantity, store.price
+        for currency, (bids, offers) in self.books.items():
+            while bids and offers:
+                bid = bids[0][2]
+                offer = offers[0][2]
+                bid_price, offer_price = prices[bid], prices[offer]
+                if bid_price < offer_price:
+                    break
+                quantity = min(quantities[bid], quantities[offer])
+                # partial fills stay at the top of their heap with the remainder
+                quantities[bid] -= quantity
+                quantities[offer] -= quantity
+                if quantities[bid] == 0:
+                    heapq.heappop(bids)
+                    store.release(bid)
+                if quantities[offer] == 0:
+                    heapq.heappop(offers)
+                    store.release(offer)
+                if creator[bid] != creator[offer]:
+                    self.match_buyers.append(creator[bid])
+                    self.match_sellers.append(creator[offer])
+                    self.match_quantity.append(quantity)
+                    self.match_bid_price.append(bid_price)
+                    self.match_offer_price.append(offer_price)
+                    self.match_currency.append(currency)
+                    self.matched_value += quantity * (bid_price + offer_price) / 2
+                    self.matched_quantity += quantity
+
+    @property
+    def matches(self) -> List[Match]:
+        return [Match(Order(self.creators[self.match_buyers[i]], False, self.match_quantity[i], self.match_bid_price[i], self.match_currency[i]),
+                Order(self.creators[self.match_sellers[i]], True, self.match_quantity[i], self.match_offer_price[i], self.match_currency[i]))
+            for i in range(len(self.match_quantity))]
+
+    @property
+    def match_count(self) -> int:
+        return len(self.match_quantity)
+
+    @property
+    def clearing_price(self) -> Double:
+        return self.compute_clearing_price()
 
+    # quantity weighted average of the match midpoints, kept as running sums so this is O(1)
     def compute_clearing_price(self) -> Double:
-        if len(self.matches) == 0:   
-            return 0   
-        
-        clearing_price = 0   
-        cumulative_quantity = 0
-        for match in self.matches:
-            cumulative_quantity += match.Bid.Quantity
-            clearing_price += match.Bid.Quantity * (match.Bid.Price + match.Offer.Price) / 2
-        
-        return clearing_price / cumulative_quantity
+        if self.matched_quantity == 0:
+            return 0
+        return self.matched_value / self.matched_quantity
 
+    def consume_matches(self) -> MatchBatch:
+        """Hands out every outstanding match for settlement and resets the running clearing price."""
+        batch = MatchBatch(np.frombuffer(self.match_buyers, dtype=np.int64), np.frombuffer(self.match_sellers, dtype=np.int64),
+            np.frombuffer(self.match_quantity, dtype=np.int64), np.frombuffer(self.match_bid_price, dtype=np.float64),
+            np.frombuffer(self.match_offer_price, dtype=np.float64), np.frombuffer(self.match_currency, dtype=np.int8))
+        self.last_clearing_price = self.compute_clearing_price()
+        self.last_matched_quantity = self.matched_quantity
+        self.last_match_count = len(self.match_quantity)
+        self.clear_matches()
+        return batch
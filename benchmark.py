@@ -0,0 +1,133 @@
+from argparse import ArgumentParser
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+from CDA import CDA
+from data import DataReader, SharedMarketData
+from model import FXModel
+from runner import RunSpec, run_batch
+from synthetic_data import write_tick_file
+
+LINEAR_PARAMS = (0.05, 0.1) # fixed trade signal so model timings don't depend on a regression fit
+
+def timed(function, repeat=3):
+    """Best wall time of repeat calls, and the last return value."""
+    best = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+def bench_data(directory, num_ticks):
+    results = []
+    for file_format in ("month", "year"):
+        path = write_tick_file(os.path.join(directory, "bench_" + file_format + "_" + str(num_ticks) + ".csv"), num_ticks, file_format)
+        seconds, reader = timed(lambda: DataReader(path, cache=False), repeat=1)
+        results.append({"name": "data.parse", "params": {"format": file_format, "ticks": num_ticks},
+            "seconds": seconds, "rate": num_ticks / seconds, "unit": "ticks/s"})
+        DataReader(path) # builds the .npy cache
+        seconds, reader = timed(lambda: DataReader(path))
+        results.append({"name": "data.cached_load", "params": {"format": file_format, "ticks": num_ticks},
+            "seconds": seconds, "rate": num_ticks / seconds, "unit": "ticks/s"})
+        for unit in ("minute", "hour"):
+            seconds, bars = timed(lambda: reader.get_bars(unit))
+            results.append({"name": "data.resample", "params": {"format": file_format, "ticks": num_ticks, "unit": unit},
+                "seconds": seconds, "rate": num_ticks / seconds, "unit": "ticks/s"})
+        seconds, bars = timed(lambda: DataReader(path, stream=True, cache=False).get_hour_data(), repeat=1)
+        results.append({"name": "data.stream_resample", "params": {"format": file_format, "ticks": num_ticks, "unit": "hour"},
+            "seconds": seconds, "rate": num_ticks / seconds, "unit": "ticks/s"})
+    return results
+
+def fill_book(depth, seed=0):
+    """A CDA with depth resting orders per side spread around 1.2, none of them crossing."""
+    rng = np.random.default_rng(seed)
+    cda = CDA()
+    for side, prices in ((False, 1.2 - rng.uniform(0.0001, 0.01, depth)), (True, 1.2 + rng.uniform(0.0001, 0.01, depth))):
+        for i, price in enumerate(prices.tolist()):
+            cda.submit("bank" + str(i % 10), side, 1000, price, i % 2)
+    return cda
+
+def bench_cda(depths, crossing=1000):
+    """match_orders on a deep book when a batch of crossing orders arrives, the shape of one model step."""
+    results = []
+    for depth in depths:
+        def match():
+            cda = fill_book(depth)
+            rng = np.random.default_rng(1)
+            for i, price in enumerate((1.2 + rng.uniform(0, 0.005, crossing)).tolist()):
+                cda.submit("trader" + str(i), False, 500, price, i % 2)
+            start = time.perf_counter()
+            cda.match_orders()
+            return time.perf_counter() - start, cda.match_count
+        runs = [match() for i in range(3)]
+        seconds = min(run[0] for run in runs)
+        results.append({"name": "cda.match_orders", "params": {"depth": depth, "crossing": crossing, "matches": runs[0][1]},
+            "seconds": seconds, "rate": runs[0][1] / seconds, "unit": "matches/s"})
+    return results
+
+def bench_model(market_data, sizes, steps, population):
+    results = []
+    for num_banks, num_traders in sizes:
+        model = FXModel(num_banks, num_traders, LINEAR_PARAMS, market_data, population, seed=0)
+        num_steps = min(steps, model.max_steps - 1)
+        start = time.perf_counter()
+        for i in range(num_steps):
+            model.step()
+        seconds = time.perf_counter() - start
+        results.append({"name": "model.step", "params": {"banks": num_banks, "traders": num_traders, "population": population, "steps": num_steps},
+            "seconds": seconds, "rate": num_steps / seconds, "unit": "steps/s"})
+    return results
+
+def bench_batch(market_data, num_runs, num_banks, num_traders, processes):
+    specs = [RunSpec(i, num_banks, num_traders, LINEAR_PARAMS, market_data, seed=0) for i in range(num_runs)]
+    start = time.perf_counter()
+    steps = sum(result.summary["steps"] for result in run_batch(specs, processes))
+    seconds = time.perf_counter() - start
+    return [{"name": "batch_run", "params": {"runs": num_runs, "banks": num_banks, "traders": num_traders, "processes": processes, "steps": steps},
+        "seconds": seconds, "rate": num_runs / seconds, "unit": "runs/s"}]
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+        "numpy": np.__version__, "machine": platform.machine(), "cpus": os.cpu_count()}
+
+def run_benchmarks(quick=False, processes=None, directory=None):
+    """Runs the whole suite on synthetic data and returns the report as a dict."""
+    num_ticks = 200000 if quick else 2000000
+    depths = [100, 1000] if quick else [100, 1000, 10000, 100000]
+    sizes = [(3, 10), (10, 10)] if quick else [(3, 10), (10, 10), (10, 100), (30, 100)]
+    steps = 20 if quick else 100
+    with tempfile.TemporaryDirectory(dir=directory) as directory:
+        results = bench_data(directory, num_ticks)
+        results += bench_cda(depths)
+        # about 2 weeks of hourly bars for the model and batch benchmarks
+        path = write_tick_file(os.path.join(directory, "bench_model.csv"), 600000, seed=1)
+        with SharedMarketData(DataReader(path, cache=False).get_hour_data()) as market_data:
+            results += bench_model(market_data, sizes, steps, population=False)
+            results += bench_model(market_data, sizes, steps, population=True)
+            results += bench_batch(market_data, 4 if quick else 16, 3, 10, processes)
+    return {"environment": environment(), "quick": quick, "results": results}
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark data loading, CDA matching, model steps and batch runs on synthetic ticks.")
+    parser.add_argument("-o", "--output", default="./results/benchmark.json", help= "Where to write the JSON report.")
+    parser.add_argument("-q", "--quick", action="store_true", help= "Smaller sizes for a fast smoke run.")
+    parser.add_argument("-j", "--processes", type=int, default=None, help= "Worker processes for the batch benchmark.")
+    args = parser.parse_args()
+    report = run_benchmarks(args.quick, args.processes)
+    for result in report["results"]:
+        params = " ".join(key + "=" + str(value) for key, value in result["params"].items())
+        print("{:<22} {:<60} {:>9.4f}s {:>14.1f} {}".format(result["name"], params, result["seconds"], result["rate"], result["unit"]))
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print("Report written to " + args.output)
@@ -0,0 +1,154 @@
+import json
+import os
+import numpy as np
+from model import BankAgent, FXModel
+from population import TraderPopulation
+
+def book_arrays(cda):
+    """The CDA heaps as flat (currency, side, key, arrival, handle) columns, in heap order."""
+    rows = [(currency, side, key, arrival, handle) for currency, book in cda.books.items()
+        for side, heap in enumerate(book) for key, arrival, handle in heap]
+    columns = list(zip(*rows)) if rows else [()] * 5
+    return {"book_currency": np.array(columns[0], dtype=np.int64), "book_side": np.array(columns[1], dtype=np.int8),
+        "book_key": np.array(columns[2], dtype=np.float64), "book_arrival": np.array(columns[3], dtype=np.int64),
+        "book_handle": np.array(columns[4], dtype=np.int64)}
+
+def cda_state(cda):
+    """(header, arrays) for one CDA: its resting orders, outstanding matches and running totals."""
+    store = cda.store
+    header = {"creators": cda.creators, "sequence": cda.sequence,
+        "matched_value": cda.matched_value, "matched_quantity": cda.matched_quantity,
+        "last_clearing_price": cda.last_clearing_price, "last_matched_quantity": cda.last_matched_quantity,
+        "last_match_count": cda.last_match_count}
+    arrays = {
+        "store_creator": np.frombuffer(store.creator, dtype=np.int64), "store_side": np.frombuffer(store.side, dtype=np.int8),
+        "store_quantity": np.frombuffer(store.quantity, dtype=np.int64), "store_price": np.frombuffer(store.price, dtype=np.float64),
+        "store_currency": np.frombuffer(store.currency, dtype=np.int8), "store_free": np.array(store.free, dtype=np.int64),
+        "match_buyers": np.frombuffer(cda.match_buyers, dtype=np.int64), "match_sellers": np.frombuffer(cda.match_sellers, dtype=np.int64),
+        "match_quantity": np.frombuffer(cda.match_quantity, dtype=np.int64), "match_bid_price": np.frombuffer(cda.match_bid_price, dtype=np.float64),
+        "match_offer_price": np.frombuffer(cda.match_offer_price, dtype=np.float64), "match_currency": np.frombuffer(cda.match_currency, dtype=np.int8),
+    }
+    arrays.update(book_arrays(cda))
+    return header, arrays
+
+def restore_cda(cda, header, arrays):
+    cda.creators = header["creators"]
+    cda.creator_codes = {creator: code for code, creator in enumerate(cda.creators)}
+    cda.sequence = header["sequence"]
+    store = cda.store
+    for name in ("creator", "side", "quantity", "price", "currency"):
+        getattr(store, name).frombytes(arrays["store_" + name].tobytes())
+    store.free = arrays["store_free"].tolist()
+    for currency, side, key, arrival, handle in zip(arrays["book_currency"].tolist(), arrays["book_side"].tolist(),
+            arrays["book_key"].tolist(), arrays["book_arrival"].tolist(), arrays["book_handle"].tolist()):
+        cda.get_book(currency)[side].append((key, arrival, handle)) # saved in heap order, so still valid heaps
+    for name in ("buyers", "sellers", "quantity", "bid_price", "offer_price", "currency"):
+        getattr(cda, "match_" + name).frombytes(arrays["match_" + name].tobytes())
+    cda.matched_value = header["matched_value"]
+    cda.matched_quantity = header["matched_quantity"]
+    cda.last_clearing_price = header["last_clearing_price"]
+    cda.last_matched_quantity = header["last_matched_quantity"]
+    cda.last_match_count = header["last_match_count"]
+
+def save_checkpoint(model, path):
+    """Writes everything needed to continue the model, except its market data, to one compressed .npz."""
+    banks = [agent for agent in model.schedule.agents if isinstance(agent, BankAgent)]
+    populations = [agent for agent in model.schedule.agents if isinstance(agent, TraderPopulation)]
+    random_state = model.random.getstate()
+    header = {
+        "num_banks": model.num_banks, "num_traders": model.num_traders, "population": model.population,
+        "params": [float(param) for param in model.params],
+        "seed": model.seed_sequence.entropy, "spawn_key": list(model.seed_sequence.spawn_key),
+        "current_step": model.current_step, "schedule_steps": model.schedule.steps, "schedule_time": model.schedule.time,
+        "num_trades": model.num_trades,
+        "eur_volume": float(model.eur_volume), "usd_volume": float(model.usd_volume),
+        "scheduled": [agent.unique_id for agent in model.schedule.agents],
+        "pairs": [pair.name for pair in model.pairs], "books": [],
+        "bit_generator": model.rng.bit_generator.state,
+        "random_version": random_state[0], "random_gauss": random_state[2],
+        "next_uniform": model.draws.next_uniform, "next_normal": model.draws.next_normal,
+        "metrics_size": model.datacollector.size,
+    }
+    arrays = {
+        "balances": np.array([column[:model.ledger.size] for column in model.ledger.columns]),
+        "pair_bids": model.pair_bids, "pair_offers": model.pair_offers,
+        "pair_trades": model.pair_trades, "pair_volumes": model.pair_volumes,
+        "rate_offsets": np.array([bank.rate_offsets for bank in banks]),
+        "population_active": np.concatenate([population.active for population in populations]) if populations else np.zeros(0, dtype=bool),
+        "random_state": np.array(random_state[1], dtype=np.uint32),
+        "uniforms": model.draws.uniforms, "normals": model.draws.normals,
+        "metrics": model.datacollector.values[:model.datacollector.size], "metrics_totals": model.datacollector.totals,
+    }
+    for pair, cda in enumerate(model.pair_books.books):
+        book_header, cda_arrays = cda_state(cda)
+        header["books"].append(book_header)
+        arrays.update({"pair" + str(pair) + "_" + name: values for name, values in cda_arrays.items()})
+    arrays["header"] = np.array(json.dumps(header))
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path) # a crash mid-write leaves the previous checkpoint intact
+
+def read_checkpoint_header(path):
+    """The settings and position of a checkpoint, without loading its arrays."""
+    with np.load(path) as arrays:
+        return json.loads(str(arrays["header"]))
+
+def load_checkpoint(path, running_data, seed=None, linear_params=None):
+    """Rebuilds a model from a checkpoint so it continues from the saved step.
+
+    running_data must be the same data the model was started on. Passing a seed
+    replaces the restored random streams, and passing linear_params replaces the
+    trade signal, so one warm-up can be forked into differing continuations.
+    """
+    with np.load(path) as arrays:
+        arrays = dict(arrays)
+    header = json.loads(str(arrays["header"]))
+    model = FXModel(header["num_banks"], header["num_traders"], tuple(header["params"]), running_data, header["population"],
+        np.random.SeedSequence(header["seed"], spawn_key=tuple(header["spawn_key"])))
+
+    model.current_step = header["current_step"]
+    model.schedule.steps, model.schedule.time = header["schedule_steps"], header["schedule_time"]
+    model.num_trades = header["num_trades"]
+    model.eur_volume = header["eur_volume"]
+    model.usd_volume = header["usd_volume"]
+    if [pair.name for pair in model.pairs] != header["pairs"]:
+        raise ValueError("Checkpoint " + path + " trades " + ", ".join(header["pairs"]) + ", not the pairs given")
+    for column, balances in zip(model.ledger.columns, arrays["balances"]):
+        column[:len(balances)] = balances
+    model.pair_bids[:] = arrays["pair_bids"]
+    model.pair_offers[:] = arrays["pair_offers"]
+    model.pair_trades[:] = arrays["pair_trades"]
+    model.pair_volumes[:] = arrays["pair_volumes"]
+    banks = [agent for agent in model.schedule.agents if isinstance(agent, BankAgent)]
+    for bank, rate_offsets in zip(banks, arrays["rate_offsets"].tolist()):
+        bank.rate_offsets = rate_offsets
+    position = 0
+    for population in [agent for agent in model.schedule.agents if isinstance(agent, TraderPopulation)]:
+        population.active[:] = arrays["population_active"][position:position + len(population.active)]
+        position += len(population.active)
+    scheduled = set(header["scheduled"])
+    for agent in list(model.schedule.agents):
+        if agent.unique_id not in scheduled:
+            model.schedule.remove(agent)
+
+    for pair, cda in enumerate(model.pair_books.books):
+        prefix = "pair" + str(pair) + "_"
+        restore_cda(cda, header["books"][pair], {name[len(prefix):]: values for name, values in arrays.items() if name.startswith(prefix)})
+
+    recorder = model.datacollector
+    if len(recorder.values) < header["metrics_size"]:
+        recorder.values = np.zeros((header["metrics_size"], recorder.values.shape[1]))
+    recorder.values[:header["metrics_size"]] = arrays["metrics"]
+    recorder.size = header["metrics_size"]
+    recorder.totals = arrays["metrics_totals"]
+
+    if seed is None:
+        model.rng.bit_generator.state = header["bit_generator"]
+        model.random.setstate((header["random_version"], tuple(arrays["random_state"].tolist()), header["random_gauss"]))
+        model.draws.uniforms, model.draws.normals = arrays["uniforms"], arrays["normals"]
+        model.draws.next_uniform, model.draws.next_normal = header["next_uniform"], header["next_normal"]
+    else:
+        model.reseed(seed)
+    if linear_params is not None:
+        model.params = linear_params
+    return model
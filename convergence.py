@@ -0,0 +1,73 @@
+import math
+import numpy as np
+from metrics import COLUMNS
+
+ACTIVITY_COLUMNS = ["Trades", "EUR Volume", "USD Volume"]
+
+class ConvergenceTracker:
+    """Online spread correlation statistics over a stream of finished runs.
+
+    Each run is folded in once. Welford updates keep the per-step mean of every
+    metric across runs, and the spread-vs-activity correlations of those mean
+    series are available after every run without revisiting earlier runs.
+    Run-to-run uncertainty is tracked with a Welford mean and variance of the
+    Fisher z of each run's own correlations. That gives a confidence interval
+    which narrows as runs agree, and optionally a stopping point.
+    """
+    def __init__(self, tolerance=None, z_critical=1.96, min_runs=3):
+        self.tolerance = tolerance
+        self.z_critical = z_critical
+        self.min_runs = min_runs
+        self.n = 0
+        self.columns = None
+        self.mean = None # per step, per metric
+        self.m2 = None
+        self.z_mean = np.zeros(len(ACTIVITY_COLUMNS))
+        self.z_m2 = np.zeros(len(ACTIVITY_COLUMNS))
+
+    def add(self, result):
+        """Folds in one RunResult and returns the current (trades, euros, dollars) correlations with spread."""
+        metrics = result.metrics
+        self.columns = result.columns
+        self.n += 1
+        if self.mean is None:
+            self.mean = np.zeros_like(metrics)
+            self.m2 = np.zeros_like(metrics)
+        steps = min(len(self.mean), len(metrics)) # runs on the same data all have the same length
+        self.mean, self.m2, metrics = self.mean[:steps], self.m2[:steps], metrics[:steps]
+        delta = metrics - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (metrics - self.mean)
+
+        z = np.arctanh(np.clip(self.spread_correlations(metrics), -0.999999, 0.999999))
+        z_delta = z - self.z_mean
+        self.z_mean += z_delta / self.n
+        self.z_m2 += z_delta * (z - self.z_mean)
+        return self.correlations()
+
+    @staticmethod
+    def spread_correlations(metrics):
+        columns = [COLUMNS.index("Spread")] + [COLUMNS.index(name) for name in ACTIVITY_COLUMNS]
+        return np.corrcoef(metrics[:, columns], rowvar=False)[0, 1:]
+
+    def correlations(self):
+        return tuple(self.spread_correlations(self.mean))
+
+    def variance(self):
+        """Per-step variance of every metric across the runs seen so far."""
+        return self.m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self.mean)
+
+    def confidence_interval(self):
+        """Lower and upper bounds on each run-level spread correlation, or None before two runs."""
+        if self.n < 2:
+            return None
+        half_width = self.z_critical * np.sqrt(self.z_m2 / (self.n - 1) / self.n)
+        return np.tanh(self.z_mean - half_width), np.tanh(self.z_mean + half_width)
+
+    def interval_width(self):
+        interval = self.confidence_interval()
+        return math.inf if interval is None else float((interval[1] - interval[0]).max())
+
+    @property
+    def converged(self):
+        return self.tolerance is not None and self.n >= self.min_runs and self.interval_width() < self.tolerance
@@ -1,38 +1,279 @@
 from datetime import datetime
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 
+CACHE_COLUMNS = ["date", "bid", "offer"]
+
+def fingerprint(filename):
+    """Identifies one version of a data file by its absolute path, size and modification time."""
+    stat = os.stat(filename)
+    return {"path": os.path.abspath(filename), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+BAR_NANOSECONDS = {"minute": 60 * 10**9, "hour": 3600 * 10**9, "six_hour": 3600 * 10**9}
+
+class BarAggregator:
+    """Online mean bid/offer bars over time-ordered tick chunks.
+
+    Each chunk is bucketed with vectorized sums. The last, possibly unfinished,
+    bucket is carried into the next chunk, so memory stays constant in the length
+    of the file. "six_hour" keeps the hour bars starting at hours 0, 6, 12 and 18,
+    matching what get_six_hour_data has always returned.
+    """
+    def __init__(self, unit):
+        self.unit = unit
+        self.width = BAR_NANOSECONDS[unit]
+        self.pending = None # (bucket, bid sum, offer sum, count)
+
+    def add(self, dates, bids, offers):
+        """Folds in a chunk of ticks and returns the bars it completed as (buckets, bids, offers)."""
+        keys = dates // self.width * self.width
+        if len(keys) > 1 and (np.diff(keys) < 0).any(): # only needed within a chunk, HistData files are in time order
+            order = np.argsort(keys, kind="stable")
+            keys, bids, offers = keys[order], bids[order], offers[order]
+        starts = np.flatnonzero(np.r_[True, np.diff(keys) != 0]) if len(keys) else np.zeros(0, dtype=np.int64)
+        buckets = keys[starts]
+        bid_sums = np.add.reduceat(bids, starts) if len(starts) else np.zeros(0)
+        offer_sums = np.add.reduceat(offers, starts) if len(starts) else np.zeros(0)
+        counts = np.diff(np.r_[starts, len(keys)])
+        if self.pending is not None:
+            bucket, bid_sum, offer_sum, count = self.pending
+            if len(buckets) and buckets[0] == bucket:
+                bid_sums[0] += bid_sum
+                offer_sums[0] += offer_sum
+                counts[0] += count
+            else:
+                buckets = np.r_[bucket, buckets]
+                bid_sums = np.r_[bid_sum, bid_sums]
+                offer_sums = np.r_[offer_sum, offer_sums]
+                counts = np.r_[count, counts]
+        if len(buckets) == 0:
+            return self.select(buckets, bid_sums, offer_sums)
+        self.pending = (buckets[-1], bid_sums[-1], offer_sums[-1], counts[-1])
+        return self.select(buckets[:-1], bid_sums[:-1] / counts[:-1], offer_sums[:-1] / counts[:-1])
+
+    def flush(self):
+        if self.pending is None:
+            return self.select(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+        bucket, bid_sum, offer_sum, count = self.pending
+        self.pending = None
+        return self.select(np.array([bucket]), np.array([bid_sum / count]), np.array([offer_sum / count]))
+
+    def select(self, buckets, bids, offers):
+        if self.unit == "six_hour":
+            keep = (buckets // BAR_NANOSECONDS["hour"]) % 6 == 0
+            return buckets[keep], bids[keep], offers[keep]
+        return buckets, bids, offers
+
 class DataReader:
-    def __init__(self, filename) -> None:
+    def __init__(self, filename, cache=True, stream=False, chunksize=1000000) -> None:
+        """Loads the tick file, or with stream=True only reads it chunk by chunk when bars are requested."""
         self.file = filename
-        self.data = None
+        self.cache_dir = self.file + ".cache"
+        self.chunksize = chunksize
+        self.data = self.load_cache() if cache else None
+        if self.data is None and not stream:
+            self.data = self.read_csv()
+            if cache:
+                self.save_cache()
+
+    def read_csv(self, chunksize=None):
         # millisecond precision tick data on monthly data sets from HistData
         if "year" in self.file:
-            self.data = pd.read_csv(self.file, usecols=[0,1,2], names=["date", "bid", "offer"], delimiter=";", converters={'date': self.convert_date})
+            data = pd.read_csv(self.file, usecols=[0,1,2], names=CACHE_COLUMNS, delimiter=";", dtype={"date": str}, chunksize=chunksize)
         else: # month case
-            self.data = pd.read_csv(self.file, usecols=[0,1,2], names=["date", "bid", "offer"], converters={'date': self.convert_date})
-    
+            data = pd.read_csv(self.file, usecols=[0,1,2], names=CACHE_COLUMNS, dtype={"date": str}, chunksize=chunksize)
+        if chunksize is not None:
+            return (self.parse_dates(chunk) for chunk in data)
+        return self.parse_dates(data)
+
+    @staticmethod
+    def parse_dates(data):
+        # "YYYYMMDD HHMM..." truncated to the minute, same as convert_date but parsed in one vectorized call
+        data["date"] = pd.to_datetime(data.date.str.slice(0, 13), format="%Y%m%d %H%M")
+        return data
+
+    def load_cache(self):
+        """Memory-maps the columnar .npy cache if it was built from this exact version of the file."""
+        try:
+            with open(os.path.join(self.cache_dir, "meta.json")) as meta_file:
+                if json.load(meta_file) != fingerprint(self.file):
+                    return None
+            columns = {name: np.load(os.path.join(self.cache_dir, name + ".npy"), mmap_mode="r") for name in CACHE_COLUMNS}
+        except (OSError, ValueError):
+            return None
+        columns["date"] = columns["date"].view("datetime64[ns]")
+        return pd.DataFrame(columns, copy=False)
+
+    def save_cache(self):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.save(os.path.join(self.cache_dir, "date.npy"), self.data.date.values.astype("datetime64[ns]").view(np.int64))
+            np.save(os.path.join(self.cache_dir, "bid.npy"), self.data.bid.to_numpy(dtype=np.float64))
+            np.save(os.path.join(self.cache_dir, "offer.npy"), self.data.offer.to_numpy(dtype=np.float64))
+            # written last so a partially written cache is never treated as valid
+            with open(os.path.join(self.cache_dir, "meta.json"), "w") as meta_file:
+                json.dump(fingerprint(self.file), meta_file)
+        except OSError:
+            pass # read-only data directory, just parse the csv next time
+
     def convert_date(self, x):
         dt = x.split(" ")
         return datetime(year=int(dt[0][0:4]), month=int(dt[0][4:6]), day=int(dt[0][6:8]), hour=int(dt[1][0:2]), minute=int(dt[1][2:4]))
 
+    def iter_chunks(self):
+        """Yields (dates as int64 ns, bids, offers) arrays of at most chunksize ticks."""
+        if self.data is not None:
+            dates = self.data.date.values.astype("datetime64[ns]").view(np.int64)
+            bids, offers = self.data.bid.to_numpy(dtype=np.float64), self.data.offer.to_numpy(dtype=np.float64)
+            for start in range(0, len(dates), self.chunksize):
+                yield dates[start:start + self.chunksize], bids[start:start + self.chunksize], offers[start:start + self.chunksize]
+            return
+        for chunk in self.read_csv(self.chunksize):
+            yield chunk.date.values.astype("datetime64[ns]").view(np.int64), chunk.bid.to_numpy(dtype=np.float64), chunk.offer.to_numpy(dtype=np.float64)
+
+    def iter_bar_chunks(self, unit):
+        """Yields the bars completed by each chunk as (buckets as int64 ns, bids, offers) arrays."""
+        aggregator = BarAggregator(unit)
+        for dates, bids, offers in self.iter_chunks():
+            bars = aggregator.add(dates, bids, offers)
+            if len(bars[0]):
+                yield bars
+        bars = aggregator.flush()
+        if len(bars[0]):
+            yield bars
+
+    def iter_bars(self, unit="hour"):
+        """Yields one (timestamp, bid, offer) bar at a time, in constant memory."""
+        for buckets, bids, offers in self.iter_bar_chunks(unit):
+            for bucket, bid, offer in zip(buckets.view("datetime64[ns]"), bids.tolist(), offers.tolist()):
+                yield pd.Timestamp(bucket), bid, offer
+
+    def count_bars(self, unit="hour"):
+        return sum(len(buckets) for buckets, _, _ in self.iter_bar_chunks(unit))
+
+    def get_bars(self, unit):
+        chunks = list(self.iter_bar_chunks(unit))
+        buckets, bids, offers = (np.concatenate([chunk[i] for chunk in chunks]) if chunks else np.zeros(0) for i in range(3))
+        index = pd.DatetimeIndex(buckets.astype(np.int64).view("datetime64[ns]"), name="date")
+        return pd.DataFrame({"bid": bids, "offer": offers}, index=index)
+
     def get_minute_data(self):
-        return self.data.groupby('date').mean()
+        return self.get_bars("minute")
 
     def get_hour_data(self):
-        return self.data.groupby(by=[self.data.date.map(lambda x: datetime(year=x.year, month=x.month, day=x.day, hour=x.hour))]).mean()
+        return self.get_bars("hour")
     
     def get_six_hour_data(self):
-        return self.data.groupby(by=[self.data.date.map(lambda x: datetime(year=x.year, month=x.month, day=x.day, hour=x.hour) if x.hour % 6 == 0 else None)]).mean()
+        return self.get_bars("six_hour")
         
     def get_data(self):
+        if self.data is None: # streaming reader, the full frame is only built on request
+            self.data = self.read_csv()
         return self.data
     
+    def get_spread_array(self, max_spread=20): # spread in pips
+        bars = self.get_six_hour_data()
+        spreads = (bars.offer.to_numpy() - bars.bid.to_numpy()) / 0.0001
+        return spreads[spreads < max_spread] # removes a few outliers at top end
+
+    def get_probability_table(self, max_spread=20):
+        """Six-hour spreads in pips and their trade probabilities, as two arrays."""
+        spreads = self.get_spread_array(max_spread)
+        return spreads, spreads / spreads.max()
+
     def get_spread_data(self): # spread in pips
-        return [(row[1] - row[0]) / 0.0001 for row in self.get_six_hour_data().itertuples(index=False) if (row[1] - row[0]) / 0.0001 < 20] # removes a few outliers at top end
+        return self.get_spread_array().tolist()
     
     def get_probability_data(self):
-        spread_data = self.get_spread_data()
-        max_spread = max(spread_data)
-        return [(spread, spread / max_spread) for spread in spread_data]
-  
+        return list(zip(*(column.tolist() for column in self.get_probability_table())))
+
+
+class SharedMarketData:
+    """A resampled market data frame published once to memory-mapped .npy files.
+
+    Pickling only carries the file location, so sending this to pool workers is
+    cheap and each worker's frame() is a zero-copy view onto the same pages.
+    """
+    def __init__(self, frame, directory=None):
+        if directory is None and os.path.isdir("/dev/shm"):
+            directory = "/dev/shm" # keep the pages in RAM rather than on disk
+        self.directory = tempfile.mkdtemp(prefix="fx_market_", dir=directory)
+        self.columns = list(frame.columns)
+        self.index_name = frame.index.name
+        np.save(os.path.join(self.directory, "values.npy"), frame.to_numpy(dtype=np.float64))
+        np.save(os.path.join(self.directory, "index.npy"), frame.index.values.astype("datetime64[ns]").view(np.int64))
+        self._frame = None
+
+    def frame(self):
+        if self._frame is None:
+            values = np.load(os.path.join(self.directory, "values.npy"), mmap_mode="r")
+            index = np.load(os.path.join(self.directory, "index.npy"), mmap_mode="r").view("datetime64[ns]")
+            self._frame = pd.DataFrame(values, index=pd.DatetimeIndex(index, name=self.index_name), columns=self.columns, copy=False)
+        return self._frame
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_frame"] = None
+        return state
+
+
+class BarFeed:
+    """Bars pulled lazily from a streaming DataReader, for FXModel to use in place of a resampled frame.
+
+    Supports the forward-only data.iat[row, column] and len(data.index) access
+    the model makes, holding only the first and current bars. It pickles as the
+    file name, so a worker opens its own stream.
+    """
+    def __init__(self, filename, unit="hour", chunksize=1000000):
+        self.filename = filename
+        self.unit = unit
+        self.chunksize = chunksize
+        self.length = None
+        self.bars = None
+
+    def reader(self):
+        return DataReader(self.filename, stream=True, chunksize=self.chunksize)
+
+    def start(self):
+        self.bars = self.reader().iter_bars(self.unit)
+        self.first = self.current = next(self.bars)
+        self.position = 0
+
+    @property
+    def index(self):
+        if self.length is None:
+            self.length = self.reader().count_bars(self.unit)
+        return range(self.length)
+
+    @property
+    def iat(self):
+        return self
+
+    def __getitem__(self, key):
+        row, column = key
+        if self.bars is None:
+            self.start()
+        if row == 0:
+            return self.first[column + 1]
+        if row < self.position:
+            raise IndexError("BarFeed only moves forward, row " + str(row) + " is behind " + str(self.position))
+        while self.position < row:
+            self.current = next(self.bars)
+            self.position += 1
+        return self.current[column + 1]
 
+    def __getstate__(self):
+        return {"filename": self.filename, "unit": self.unit, "chunksize": self.chunksize, "length": self.length, "bars": None}
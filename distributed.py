@@ -0,0 +1,398 @@
+from argparse import ArgumentParser
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing import Process, cpu_count
+from typing import Tuple
+import hashlib
+import hmac
+import ipaddress
+import os
+import pickle
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from data import DataReader, SharedMarketData, fingerprint
+from runner import RunSpec, run_model
+
+PORT = 6000
+LOCAL_KEY = b"fx-model-local" # only accepted while everything stays on loopback
+HEADER = struct.Struct("!Q")
+MAX_MESSAGE = 1 << 28 # 256 MiB, far above any RunResult
+
+# Messages are pickled tuples, each sent as its length, an HMAC of it under the
+# shared key and the pickle itself. Nothing is unpickled before its HMAC checks
+# out, so the key is what stands between the network and running code: anywhere
+# off loopback it must be a secret of the caller's, never LOCAL_KEY.
+#   worker -> coordinator: ("ready", name), ("heartbeat", job_id), ("result", job_id, RunResult), ("error", job_id, message)
+#   coordinator -> worker: ("job", job_id, Job, heartbeat seconds), ("wait", seconds), ("stop",)
+# Every message but a heartbeat is answered with the worker's next instruction.
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+def check_key(key, host):
+    if not key or (key == LOCAL_KEY and not is_loopback(host)):
+        raise ValueError("Talking to " + str(host) + " off loopback needs a secret key of your own")
+
+def send(sock, message, key=LOCAL_KEY):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(payload)) + hmac.new(key, payload, "sha256").digest() + payload)
+
+def receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def receive(sock, key=LOCAL_KEY):
+    size, = HEADER.unpack(receive_exactly(sock, HEADER.size))
+    if size > MAX_MESSAGE: # refused before buffering anything the sender chose
+        raise ConnectionError("Message of " + str(size) + " bytes is over the " + str(MAX_MESSAGE) + " byte limit")
+    digest = receive_exactly(sock, 32)
+    payload = receive_exactly(sock, size)
+    if not hmac.compare_digest(digest, hmac.new(key, payload, "sha256").digest()):
+        raise ConnectionError("Message failed authentication, check the key")
+    return pickle.loads(payload)
+
+def content_digest(filename):
+    """Identifies a data file by its contents, so copies on other hosts can be checked against it."""
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as data_file:
+        for chunk in iter(lambda: data_file.read(1 << 20), b""):
+            sha1.update(chunk)
+    return {"name": os.path.basename(filename), "size": os.path.getsize(filename), "sha1": sha1.hexdigest()}
+
+@dataclass
+class Job:
+    """One run of one configuration, everything a worker needs to build its RunSpec.
+
+    The linear params are fitted once by the coordinator, so workers only need
+    the running data, which they check against digest before running.
+    """
+    run_id: int
+    config: dict
+    seed: int
+    linear_params: Tuple[float, float]
+    digest: dict # content_digest of config["running_data"]
+    metadata: dict = None
+
+class WorkerData:
+    """A worker's own copies of the running data, each verified and loaded once for all its jobs."""
+    def __init__(self, data_dir=None):
+        self.data_dir = data_dir
+        self.digests = {} # local fingerprint -> content digest, so each file is hashed once
+        self.market_data = {}
+
+    def resolve(self, path, digest):
+        """The local file with digest's contents: path itself, or its name in the data directory."""
+        candidates = [path] + ([os.path.join(self.data_dir, digest["name"])] if self.data_dir else [])
+        for candidate in candidates:
+            if not os.path.exists(candidate) or os.path.getsize(candidate) != digest["size"]:
+                continue
+            key = tuple(fingerprint(candidate).values())
+            if key not in self.digests:
+                self.digests[key] = content_digest(candidate)
+            if self.digests[key]["sha1"] == digest["sha1"]:
+                return candidate
+        raise FileNotFoundError("No copy of " + digest["name"] + " with sha1 " + digest["sha1"] + " in " + ", ".join(candidates))
+
+    def load(self, path, digest):
+        path = self.resolve(path, digest)
+        if path not in self.market_data:
+            self.market_data[path] = SharedMarketData(DataReader(path).get_hour_data())
+        return self.market_data[path]
+
+    def close(self):
+        for shared in self.market_data.values():
+            shared.close()
+        self.market_data = {}
+
+def run_job(job, data):
+    config = job.config
+    spec = RunSpec(job.run_id, config["num_banks"], config["num_traders"], job.linear_params, data.load(config["running_data"], job.digest),
+        config["population"], job.seed, config, metadata=job.metadata)
+    return run_model(spec)
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class Coordinator:
+    """Hands jobs to workers over TCP and collects their results.
+
+    Each job handed out is leased to its worker, which renews the lease with
+    heartbeats while it runs. A job whose worker disconnects, reports an error
+    or lets its lease run out goes back on the queue, up to max_attempts
+    times, after which it is recorded in failed. A late result for a job that
+    was handed out again is still taken if it is the first to arrive.
+    """
+    def __init__(self, jobs, address=("127.0.0.1", PORT), key=LOCAL_KEY, lease=60, max_attempts=3):
+        check_key(key, address[0])
+        self.jobs = list(jobs)
+        self.key = key
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.pending = deque(range(len(self.jobs)))
+        self.attempts = [0] * len(self.jobs)
+        self.leases = {} # job id -> lease expiry
+        self.done = set()
+        self.failed = {} # job id -> last error
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                coordinator.handle(self.request, self.client_address)
+
+        self.server = Server(address, Handler)
+        self.address = self.server.server_address
+
+    def finished(self):
+        return len(self.done) + len(self.failed) == len(self.jobs)
+
+    def next_job(self):
+        with self.lock:
+            if self.pending:
+                job_id = self.pending.popleft()
+                self.attempts[job_id] += 1
+                self.leases[job_id] = time.monotonic() + self.lease
+                return ("job", job_id, self.jobs[job_id], self.lease / 3)
+            if self.finished():
+                return ("stop",)
+            return ("wait", 1.0) # leased jobs may still come back
+
+    def renew(self, job_id):
+        with self.lock:
+            if job_id in self.leases:
+                self.leases[job_id] = time.monotonic() + self.lease
+
+    def finish(self, job_id, result):
+        with self.lock:
+            if job_id in self.done:
+                return
+            self.results.put(result) # queued before the job counts as done, so serve() never stops short of it
+            self.done.add(job_id)
+            self.leases.pop(job_id, None)
+            self.failed.pop(job_id, None)
+            if job_id in self.pending:
+                self.pending.remove(job_id)
+
+    def lose(self, job_id, reason):
+        with self.lock:
+            if self.leases.pop(job_id, None) is None:
+                return # already finished or requeued
+            if self.attempts[job_id] < self.max_attempts:
+                self.pending.append(job_id)
+                print("Requeued run " + str(self.jobs[job_id].run_id) + ": " + reason)
+            else:
+                self.failed[job_id] = reason
+                print("Run " + str(self.jobs[job_id].run_id) + " failed " + str(self.max_attempts) + " times, last: " + reason)
+
+    def expire(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [job_id for job_id, expiry in self.leases.items() if expiry < now]
+        for job_id in expired:
+            self.lose(job_id, "lease expired")
+
+    def handle(self, sock, address):
+        held = set() # jobs handed to this connection and not yet answered
+        try:
+            while True:
+                message = receive(sock, self.key)
+                if message[0] == "heartbeat":
+                    self.renew(message[1])
+                    continue
+                if message[0] == "result":
+                    held.discard(message[1])
+                    self.finish(message[1], message[2])
+                elif message[0] == "error":
+                    held.discard(message[1])
+                    self.lose(message[1], message[2])
+                reply = self.next_job()
+                if reply[0] == "job":
+                    held.add(reply[1])
+                send(sock, reply, self.key)
+                if reply[0] == "stop":
+                    return
+        except EOFError:
+            pass
+        except OSError as error: # including a message that failed authentication
+            print("Dropped worker at " + address[0] + ": " + str(error))
+        finally:
+            for job_id in held:
+                self.lose(job_id, "worker disconnected")
+
+    def serve(self):
+        """Serves until every job has finished or failed, yielding each RunResult as it arrives."""
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            while not (self.finished() and self.results.empty()):
+                self.expire()
+                try:
+                    yield self.results.get(timeout=0.5)
+                except queue.Empty:
+                    pass
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+
+def connect(address, timeout=30):
+    """Connects to the coordinator, retrying until timeout so workers can be started first."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection(address)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+def heartbeat(sock, key, lock, job_id, interval, stopped):
+    while not stopped.wait(interval):
+        try:
+            with lock:
+                send(sock, ("heartbeat", job_id), key)
+        except OSError:
+            return
+
+def work(address, key=LOCAL_KEY, data_dir=None, timeout=30):
+    """Runs jobs from the coordinator at address until it has none left, returning how many it ran."""
+    check_key(key, address[0])
+    sock = connect(address, timeout)
+    lock = threading.Lock() # the heartbeat thread shares the socket
+    data = WorkerData(data_dir)
+    name = socket.gethostname() + ":" + str(os.getpid())
+    runs = 0
+    try:
+        reply = ("ready", name)
+        while True:
+            with lock:
+                send(sock, reply, key)
+            message = receive(sock, key)
+            if message[0] == "stop":
+                break
+            if message[0] == "wait":
+                time.sleep(message[1])
+                reply = ("ready", name)
+                continue
+            job_id, job, interval = message[1:]
+            stopped = threading.Event()
+            beat = threading.Thread(target=heartbeat, args=(sock, key, lock, job_id, interval, stopped), daemon=True)
+            beat.start()
+            try:
+                reply = ("result", job_id, run_job(job, data))
+                runs += 1
+            except Exception as error:
+                reply = ("error", job_id, name + ": " + repr(error))
+            finally:
+                stopped.set()
+                beat.join()
+    except EOFError:
+        pass # the coordinator finished
+    except OSError as error:
+        print("Worker " + name + " lost the coordinator: " + str(error))
+    finally:
+        data.close()
+        sock.close()
+    print("Worker " + name + " ran " + str(runs) + " runs")
+    return runs
+
+def worker_process(address, key, data_dir):
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0)) # still close the shared market data when killed
+    work(address, key, data_dir)
+
+def make_jobs(config, num_runs, seed, store=None):
+    """Jobs for runs 0 to num_runs - 1 of config, leaving out any already in store."""
+    from regression import generate_linear_model_params
+    from sweep import datasets
+    linear_params = generate_linear_model_params(config["training_data"])
+    digest = content_digest(config["running_data"])
+    metadata = datasets(config)
+    return [Job(run_id, config, seed, linear_params, digest, metadata) for run_id in range(num_runs)
+        if store is None or not store.has(config, run_id, seed)]
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+def coordinate(args):
+    from tqdm import tqdm
+    from headless import report_stats
+    from results import ResultStore
+    from rng import seed_sequence
+    seed = args.seed if args.seed is not None else seed_sequence().entropy
+    print("Seed: " + str(seed))
+    config = {"num_banks": args.bank, "num_traders": args.trader, "training_data": args.training, "running_data": args.running, "population": args.population}
+    store = ResultStore(args.store)
+    jobs = make_jobs(config, args.runs, seed, store)
+    if len(jobs) < args.runs:
+        print(str(args.runs - len(jobs)) + " runs already stored, " + str(len(jobs)) + " to go")
+    coordinator = Coordinator(jobs, (args.bind, args.port), args.key, args.lease, args.attempts)
+    print("Coordinating on " + args.bind + ":" + str(coordinator.address[1]))
+    with tqdm(total=len(jobs), unit="run") as pbar:
+        for result in coordinator.serve():
+            store.save(result)
+            pbar.update(1)
+    if coordinator.failed:
+        print(str(len(coordinator.failed)) + " runs failed: " + ", ".join(str(jobs[job_id].run_id) for job_id in sorted(coordinator.failed)))
+    report_stats(store.batch(config, seed, range(args.runs)), args.trader)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Spread a batch over many hosts: one coordinator hands out runs, workers anywhere pull and run them.")
+    parser.add_argument("mode", choices=["coordinator", "worker"])
+    parser.add_argument("--key", default=os.environ.get("FX_DISTRIBUTED_KEY"),
+        help= "Secret shared by the coordinator and workers, authenticating every message. Defaults to $FX_DISTRIBUTED_KEY. Required unless on loopback.")
+    coordinator_args = parser.add_argument_group("coordinator")
+    coordinator_args.add_argument("-b", "--bank", type=int, default=10, help= "The number of banks in a model")
+    coordinator_args.add_argument("-t", "--trader", type=int, default=50, help= "The number of traders per bank in a model")
+    coordinator_args.add_argument("-n", "--runs", type=int, default=1, help= "The number of times to run the model.")
+    coordinator_args.add_argument("-d", "--training", default="none", help= "The relative or absolute path to the training data.")
+    coordinator_args.add_argument("-r", "--running", default="../data/year_2021_tick_data.csv", help= "The relative or absolute path to the run time data.")
+    coordinator_args.add_argument("-s", "--seed", type=int, help= "Seed for the batch.")
+    coordinator_args.add_argument("-p", "--population", action="store_true", help= "Step each bank's traders as one vectorized population.")
+    coordinator_args.add_argument("--store", default="./results/store", help= "Result store the runs are streamed into. Runs already in it are skipped.")
+    coordinator_args.add_argument("--bind", default="127.0.0.1", help= "Interface to listen on, 0.0.0.0 for workers on other hosts.")
+    coordinator_args.add_argument("--port", type=int, default=PORT)
+    coordinator_args.add_argument("--lease", type=float, default=60, help= "Seconds without a heartbeat before a run is handed to another worker.")
+    coordinator_args.add_argument("--attempts", type=int, default=3, help= "Times a run is handed out before it counts as failed.")
+    worker_args = parser.add_argument_group("worker")
+    worker_args.add_argument("--connect", default="127.0.0.1:" + str(PORT), metavar="HOST:PORT", help= "Address of the coordinator.")
+    worker_args.add_argument("-j", "--processes", type=int, default=cpu_count(), help= "Worker processes to start on this host.")
+    worker_args.add_argument("--data-dir", help= "Where this host keeps the data files, if not at the coordinator's paths.")
+    args = parser.parse_args()
+    host = args.bind if args.mode == "coordinator" else parse_address(args.connect)[0]
+    args.key = args.key.encode() if args.key else LOCAL_KEY
+    try:
+        check_key(args.key, host)
+    except ValueError as error:
+        parser.error(str(error) + ", pass --key or set FX_DISTRIBUTED_KEY")
+    if args.mode == "coordinator":
+        coordinate(args)
+    else:
+        workers = [Process(target=worker_process, args=(parse_address(args.connect), args.key, args.data_dir)) for i in range(args.processes)]
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate() # each closes its data on SIGTERM
+                    worker.join()
@@ -0,0 +1,108 @@
+import heapq
+import numpy as np
+from model import BankAgent, Trader
+
+class EventKernel:
+    """Discrete-event loop over timestamped callbacks and a replayed tick stream.
+
+    Times are int64 nanoseconds. Scheduled events (agent wake-ups, order
+    arrivals, bookkeeping) sit in a heap of (time, sequence, callback, args).
+    Ticks are already time ordered, so they are merged in from their arrays
+    rather than pushed through the heap. A tick only notifies the quote
+    subscribers when the bid or offer actually changes.
+    """
+    def __init__(self):
+        self.queue = []
+        self.sequence = 0 # keeps same-time events in scheduling order
+        self.now = 0
+        self.bid = None
+        self.offer = None
+        self.quote_subscribers = []
+        self.events_processed = 0
+
+    def subscribe(self, callback):
+        """callback(bid, offer) is called on every quote change."""
+        self.quote_subscribers.append(callback)
+
+    def schedule(self, time, callback, *args):
+        self.sequence += 1
+        heapq.heappush(self.queue, (time, self.sequence, callback, args))
+
+    def schedule_in(self, delay, callback, *args):
+        self.schedule(self.now + delay, callback, *args)
+
+    def quote(self, time, bid, offer):
+        self.now = time
+        self.events_processed += 1
+        if bid != self.bid or offer != self.offer:
+            self.bid, self.offer = bid, offer
+            for callback in self.quote_subscribers:
+                callback(bid, offer)
+
+    def run_until(self, time):
+        """Fires every scheduled event at or before time."""
+        queue = self.queue
+        while queue and queue[0][0] <= time:
+            event_time, _, callback, args = heapq.heappop(queue)
+            self.now = event_time
+            self.events_processed += 1
+            callback(*args)
+
+    def replay(self, times, bids, offers, until=None):
+        """Replays ticks in order, firing scheduled events that fall between them."""
+        for time, bid, offer in zip(times.tolist(), bids.tolist(), offers.tolist()):
+            if until is not None and time > until:
+                break
+            if self.queue and self.queue[0][0] <= time:
+                self.run_until(time)
+            self.quote(time, bid, offer)
+        self.run_until(until if until is not None else self.now)
+
+class TickReplay:
+    """Drives an FXModel's agents from raw ticks instead of hourly steps.
+
+    Banks subscribe to quote changes and reprice immediately. Every agent
+    wakes once per wake_interval at a random phase: banks quote into the CDA
+    and match, and traders trade against their bank's current rates. Matches
+    are settled and metrics collected once per collect_interval, so a row of
+    the model's datacollector still covers a fixed stretch of market time.
+    """
+    def __init__(self, model, ticks, wake_interval=np.timedelta64(1, "m"), collect_interval=np.timedelta64(1, "h")):
+        self.model = model
+        self.kernel = EventKernel()
+        self.times = ticks.date.values.astype("datetime64[ns]").view(np.int64)
+        self.bids = ticks.bid.to_numpy(dtype=np.float64)
+        self.offers = ticks.offer.to_numpy(dtype=np.float64)
+        self.wake_interval = int(wake_interval / np.timedelta64(1, "ns"))
+        self.collect_interval = int(collect_interval / np.timedelta64(1, "ns"))
+        start, end = self.times[0], self.times[-1]
+        # trade sizes are a fraction of wealth per activation, so size them to the number of wake-ups
+        model.max_steps = max(int((end - start) // self.wake_interval), 1)
+
+        for agent in model.schedule.agents:
+            if isinstance(agent, BankAgent):
+                self.kernel.subscribe(agent.update_rates)
+            phase = int(model.draws.uniform() * self.wake_interval)
+            self.kernel.schedule(start + phase, self.wake, agent)
+        self.kernel.schedule(start + self.collect_interval, self.collect)
+
+    def wake(self, agent):
+        if isinstance(agent, BankAgent):
+            agent.cda_reactive_trade()
+            agent.cda_trade()
+        else:
+            agent.step()
+            if isinstance(agent, Trader) and agent.EUR <= 0 and agent.USD <= 0:
+                return # broke traders drop out, as Trader.step takes them off the schedule
+        self.kernel.schedule_in(self.wake_interval, self.wake, agent)
+
+    def collect(self):
+        self.model.settle_matches()
+        self.model.datacollector.collect(self.model)
+        self.model.current_step += 1
+        self.kernel.schedule_in(self.collect_interval, self.collect)
+
+    def run(self, until=None):
+        self.kernel.replay(self.times, self.bids, self.offers, until)
+        self.model.settle_matches()
+        return self.model
@@ -0,0 +1,114 @@
+import time
+START = time.perf_counter() # before the imports below, so the reported startup covers them
+from argparse import ArgumentParser
+from contextlib import ExitStack
+import os
+from checkpoint import read_checkpoint_header
+from data import DataReader, SharedMarketData
+from pairs import PairRegistry
+from profiling import StepProfiler
+from regression import generate_linear_model_params
+from results import STORE_DIR, ResultStore
+from rng import seed_sequence
+from runner import RunSpec, run_batch, warm_up
+from sweep import datasets
+
+def batch_run(num_banks, num_traders, num_runs, running_data, linear_params, population=False, seed=None, run_ids=None, checkpoint_every=0,
+        profile=False, config=None, metadata=None, pairs=(), tape_dir=None, checkpoint_dir=None, warm_start=None):
+    """Yields each run's RunResult as soon as it finishes, so the caller can store it and let it go."""
+    if run_ids is None:
+        run_ids = range(num_runs)
+    # load and resample the run time data once, every model maps the same shared copy
+    with ExitStack() as stack:
+        market_data = stack.enter_context(SharedMarketData(DataReader(running_data).get_hour_data()))
+        if pairs: # (name, path) of pairs traded alongside EURUSD
+            market_data = PairRegistry([("EURUSD", market_data)] + [(name, stack.enter_context(SharedMarketData(DataReader(path).get_hour_data())))
+                for name, path in pairs])
+        specs = [RunSpec(i, num_banks, num_traders, linear_params, market_data, population, seed, config,
+            checkpoint_every=checkpoint_every, checkpoint_dir=checkpoint_dir, profile=profile, metadata=metadata,
+            tape_dir=tape_dir, warm_start=warm_start) for i in run_ids]
+        yield from run_batch(specs)
+
+def run(num_banks, num_traders, num_runs, training_data, running_data, population=False, seed=None, replay=None, checkpoint_every=0,
+        profile=False, pairs=(), store_dir=STORE_DIR, report=print, tape=False, warm_start=None, warm_up_steps=0):
+    """Runs a batch into the result store and returns (config, query of the runs it ran or replayed).
+
+    With tape, each run's trades are also recorded to a tape.TradeTape next to its stored result.
+    With warm_start, every run is forked from the checkpoint at that path,
+    which is first written by warm_up_steps steps of one model on the batch
+    seed if it doesn't exist yet.
+    """
+    if replay is not None and seed is None:
+        raise ValueError("Replaying a run needs the seed of its batch")
+    linear_params = generate_linear_model_params(training_data)
+    if seed is None:
+        seed = seed_sequence().entropy
+    report("Seed: " + str(seed))
+    run_ids = None if replay is None else [replay]
+    config = {"num_banks": num_banks, "num_traders": num_traders, "training_data": training_data, "running_data": running_data, "population": population}
+    if pairs:
+        config["pairs"] = [list(pair) for pair in pairs]
+    if warm_start is not None:
+        if not os.path.exists(warm_start):
+            if not warm_up_steps:
+                raise ValueError("No warm-up at " + warm_start + ", give the number of steps to run one")
+            report("Warming up for " + str(warm_up_steps) + " steps into " + warm_start)
+            warm_up(warm_start, warm_up_steps, num_banks, num_traders, linear_params,
+                PairRegistry([("EURUSD", running_data)] + list(pairs)) if pairs else running_data, population, seed)
+        elif warm_up_steps and read_checkpoint_header(warm_start)["current_step"] != warm_up_steps:
+            raise ValueError("The warm-up at " + warm_start + " isn't " + str(warm_up_steps) + " steps long, remove it to run a new one")
+        config["warm_start"] = warm_start
+    store = ResultStore(store_dir)
+    profiles = []
+    # every run is kept in the result store as it finishes, the statistics are read back from it
+    for result in batch_run(num_banks, num_traders, num_runs, running_data, linear_params, population, seed, run_ids, checkpoint_every, profile,
+            config, datasets(config), pairs, store.config_dir(config) if tape else None, store.config_dir(config) if checkpoint_every > 0 else None,
+            warm_start):
+        store.save(result)
+        if profile:
+            profiles.append(result.profile)
+    if profile:
+        report(StepProfiler.merge(profiles).summary())
+    return config, store.batch(config, seed, range(num_runs) if run_ids is None else run_ids)
+
+def report_stats(query, num_traders, report=print):
+    """Reports the wealth ranges and spread correlations of the queried runs, returning their pooled final balances."""
+    bank_eur, bank_usd, trader_eur, trader_usd = balances = query.balances()
+    if num_traders > 0:
+        report("Trader Euros Range: " + str(round(trader_eur.min() / 1000000)) + " million - " + str(round(trader_eur.max() / 1000000)) + " million")
+        report("Trader Dollars Range: " + str(round(trader_usd.min() / 1000000)) + " million - " + str(round(trader_usd.max() / 1000000)) + " million")
+    report("Bank Euros Range: " + str(round(bank_eur.min() / 1000000000, 4)) + " billion - " + str(round(bank_eur.max() / 1000000000, 4)) + " billion")
+    report("Bank Dollars Range: " + str(round(bank_usd.min() / 1000000000, 4)) + " billion - " + str(round(bank_usd.max() / 1000000000, 4)) + " billion")
+    correlations = query.correlations().iloc[0]
+    report("Correlation Between Spread and Number of Trades: " + str(round(correlations["Trades"], 3)))
+    report("Correlation Between Spread and Euro Traded Volume: " + str(round(correlations["EUR Volume"], 3)))
+    report("Correlation Between Spread and Dollar Traded Volume: " + str(round(correlations["USD Volume"], 3)))
+    return balances
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Run a batch without any plotting, for batch machines and short runs. Results go to the result store.")
+    parser.add_argument("-b", "--bank", type=int, default=10, help= "The number of banks in a model")
+    parser.add_argument("-t", "--trader", type=int, default=50, help= "The number of traders per bank in a model")
+    parser.add_argument("-n", "--runs", type=int, default=1, help= "The number of times to run the model.")
+    parser.add_argument("-d", "--training", default="none", help= "The relative or absolute path to the training data.")
+    parser.add_argument("-r", "--running", default="../data/year_2021_tick_data.csv", help= "The relative or absolute path to the run time data.")
+    parser.add_argument("-s", "--seed", type=int, help= "Seed for the batch.")
+    parser.add_argument("--replay", type=int, metavar="RUN_ID", help= "Only run the given run id of the batch seeded with --seed.")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="STEPS", help= "Checkpoint each run every STEPS steps.")
+    parser.add_argument("-p", "--population", action="store_true", help= "Step each bank's traders as one vectorized population.")
+    parser.add_argument("--profile", action="store_true", help= "Time each phase of the model step and print the merged breakdown.")
+    parser.add_argument("--pair", action="append", default=[], metavar="NAME=PATH", help= "Also trade this pair, as in test.py.")
+    parser.add_argument("--tape", action="store_true", help= "Record every trade of each run to a tape file in the result store.")
+    parser.add_argument("--warm-start", metavar="PATH", help= "Fork every run from the warm-up checkpoint at PATH, running it first if it doesn't exist.")
+    parser.add_argument("--warm-up", type=int, default=0, metavar="STEPS", help= "Steps of the warm-up written to --warm-start.")
+    parser.add_argument("--store", default=STORE_DIR, help= "Result store directory.")
+    args = parser.parse_args()
+    if args.replay is not None and args.seed is None:
+        parser.error("--replay needs the --seed of the batch the run belongs to")
+    if args.warm_up and args.warm_start is None:
+        parser.error("--warm-up needs the --warm-start path to write the warm-up to")
+    print("Startup: {:.3f}s".format(time.perf_counter() - START))
+    config, query = run(args.bank, args.trader, args.runs, args.training, args.running, args.population, args.seed, args.replay,
+        args.checkpoint_every, args.profile, [tuple(pair.split("=", 1)) for pair in args.pair], args.store, tape=args.tape,
+        warm_start=args.warm_start, warm_up_steps=args.warm_up)
+    report_stats(query, args.trader)
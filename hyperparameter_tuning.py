@@ -1,111 +1,68 @@
-from model import *
 import matplotlib.pyplot as plt
-import pandas as pd
-from multiprocessing import Pool, RLock, cpu_count
-from tqdm import tqdm
-from regression import generate_linear_model_params
+from convergence import ConvergenceTracker
+from sweep import run_sweep
 
-def run_model(pid, model):
-    tqdm_text = "#" + "{}".format(pid).zfill(3)
-    n = model.max_steps - 1
-    with tqdm(total=n, desc=tqdm_text, position=pid+1) as pbar:
-        for i in range(n):
-            model.step()
-            pbar.update(1)
-    return model
+STORE_DIR = "./results/sweep"
 
-def batch_run(num_banks, num_traders, num_runs, running_data, linear_params):
-    num_processes = num_runs
-    pool = Pool(processes=num_processes, initargs=(RLock(),), initializer=tqdm.set_lock)
-    print("Initialising models...")
-    models = [FXModel(num_banks, num_traders, linear_params, running_data) for i in range(num_processes)]
-    jobs = [pool.apply_async(run_model, args=(i, m)) for i, m in enumerate(models)]
-    pool.close()
-    result_list = [job.get() for job in jobs]
-    print("\n" * (len(models) + 1))
-    return result_list
+def spread_correlations(result_list):
+    """Trades, EUR volume and USD volume correlations with spread of the mean series, in ACTIVITY_COLUMNS order."""
+    tracker = ConvergenceTracker()
+    for result in result_list:
+        tracker.add(result)
+    return tracker.correlations()
 
-def batch_run_seqeuntial_batched(num_banks, num_traders, num_runs, running_data, linear_params):
-    batches = int(num_runs / cpu_count())
-    runs_left = num_runs
-    result_lists = []
-    for i in range(1, batches + 1):
-        result_list = batch_run(num_banks, num_traders, cpu_count(), running_data, linear_params)
-        result_lists.append(result_list)
-        runs_left -= len(result_list)
-        print("Runs left: " + str(runs_left))
-    
-    if runs_left > 0:
-        result_lists.append(batch_run(num_banks, num_traders, runs_left, running_data, linear_params))
-
-    results = [j for sub in result_lists for j in sub]
-    print("\n" * (len(results) + 1))
-    return results
-
-def hyperparameter_tune_banks(num_banks, num_traders, num_runs, training_data, running_data):
+def plot_sweep(x, results, xlabel):
     trades, euros, dollars = [], [], []
-    step = int(num_banks / 5)
-    linear_params = generate_linear_model_params(training_data)
-    for i in range(step, num_banks + 1, step):
-        result_list = batch_run(i, num_traders, num_runs, training_data, running_data, linear_params)
-        data = [model.datacollector.get_model_vars_dataframe() for model in result_list]
-        df = pd.concat(data)
-        df = df.groupby(df.index).mean()
-        corr_matrix = df.corr(method="pearson")
-        trades.append(round(corr_matrix.iloc[3]["Spread"], 3))
-        euros.append(round(corr_matrix.iloc[4]["Spread"], 3))
-        dollars.append(round(corr_matrix.iloc[5]["Spread"], 3))
-    
-    plt.plot([i for i in range(step, num_banks + 1, step)], trades, label="Number of Trades")
-    plt.plot([i for i in range(step, num_banks + 1, step)], euros, label="Euro Traded Volume")
-    plt.plot([i for i in range(step, num_banks + 1, step)], dollars, label="Dollar Traded Volume")
-    plt.xlabel("Number of Banks")
+    for config, result_list in results:
+        trade_corr, euro_corr, dollar_corr = spread_correlations(result_list)
+        trades.append(round(trade_corr, 3))
+        euros.append(round(euro_corr, 3))
+        dollars.append(round(dollar_corr, 3))
+
+    plt.plot(x, trades, label="Number of Trades")
+    plt.plot(x, euros, label="Euro Traded Volume")
+    plt.plot(x, dollars, label="Dollar Traded Volume")
+    plt.xlabel(xlabel)
     plt.ylabel("Correlation with Spread")
     plt.figlegend(loc="upper right")
     plt.show()
 
-def hyperparameter_tune_traders(num_banks, num_traders, num_runs, training_data, running_data):
-    trades, euros, dollars = [], [], []
+def hyperparameter_tune_banks(num_banks, num_traders, num_runs, training_data, running_data, store_dir=STORE_DIR):
+    step = int(num_banks / 5)
+    banks = list(range(step, num_banks + 1, step))
+    grid = {"num_banks": banks, "num_traders": num_traders, "training_data": training_data, "running_data": running_data}
+    plot_sweep(banks, run_sweep(grid, num_runs, store_dir), "Number of Banks")
+
+def hyperparameter_tune_traders(num_banks, num_traders, num_runs, training_data, running_data, store_dir=STORE_DIR):
     step = int(num_traders / 5)
-    linear_params = generate_linear_model_params(training_data)
-    for i in range(step, num_traders + 1, step):
-        result_list = batch_run(num_banks, i, num_runs, training_data, running_data, linear_params)
-        data = [model.datacollector.get_model_vars_dataframe() for model in result_list]
-        df = pd.concat(data)
-        df = df.groupby(df.index).mean()
-        corr_matrix = df.corr(method="pearson")
-        trades.append(round(corr_matrix.iloc[3]["Spread"], 3))
-        euros.append(round(corr_matrix.iloc[4]["Spread"], 3))
-        dollars.append(round(corr_matrix.iloc[5]["Spread"], 3))
-    
-    plt.plot([i for i in range(step, num_traders + 1, step)], trades, label="Number of Trades")
-    plt.plot([i for i in range(step, num_traders + 1, step)], euros, label="Euro Traded Volume")
-    plt.plot([i for i in range(step, num_traders + 1, step)], dollars, label="Dollar Traded Volume")
-    plt.xlabel("Number of Traders")
-    plt.ylabel("Correlation with Spread")
-    plt.figlegend(loc="upper right")
-    plt.show()
+    traders = list(range(step, num_traders + 1, step))
+    grid = {"num_banks": num_banks, "num_traders": traders, "training_data": training_data, "running_data": running_data}
+    plot_sweep(traders, run_sweep(grid, num_runs, store_dir), "Number of Traders")
 
-def hyperparameter_tune_runs(num_banks, num_traders, num_runs, training_data, running_data):
-    linear_params = generate_linear_model_params(training_data)
-    result_list = batch_run_seqeuntial_batched(num_banks, num_traders, num_runs, training_data, running_data, linear_params)
-    data = [model.datacollector.get_model_vars_dataframe() for model in result_list]
+def hyperparameter_tune_runs(num_banks, num_traders, num_runs, training_data, running_data, tolerance=None, store_dir=STORE_DIR):
+    """Spread correlations as runs are added. With a tolerance, stops once the correlation confidence interval is narrower."""
+    grid = {"num_banks": num_banks, "num_traders": num_traders, "training_data": training_data, "running_data": running_data}
+    tracker = ConvergenceTracker(tolerance)
     trades, euros, dollars = [], [], []
-    for i in range(1, len(data) + 1):
-        df = pd.concat(data[0: i])
-        df = df.groupby(df.index).mean()
-        corr_matrix = df.corr(method="pearson")
-        trades.append(corr_matrix.iloc[3]["Spread"])
-        euros.append(corr_matrix.iloc[4]["Spread"])
-        dollars.append(corr_matrix.iloc[5]["Spread"])
+
+    def fold(result):
+        trade_corr, euro_corr, dollar_corr = tracker.add(result)
+        trades.append(trade_corr)
+        euros.append(euro_corr)
+        dollars.append(dollar_corr)
+        return tracker.converged
+
+    run_sweep(grid, num_runs, store_dir, on_result=fold)
+    if tracker.converged:
+        print("Converged after " + str(tracker.n) + " runs, interval width " + str(round(tracker.interval_width(), 4)))
 
     print("Trade Corr range: " + str(abs(min(trades)) - abs(max(trades))))
     print("Euro Vol Corr range: " + str(abs(min(euros)) - abs(max(euros))))
     print("Dollar Vol Corr range: " + str(abs(min(dollars)) - abs(max(dollars))))
 
-    plt.plot([i for i in range(1, num_runs + 1)], trades, label="Number of Trades")
-    plt.plot([i for i in range(1, num_runs + 1)], euros, label="Euro Traded Volume")
-    plt.plot([i for i in range(1, num_runs + 1)], dollars, label="Dollar Traded Volume")
+    plt.plot([i for i in range(1, tracker.n + 1)], trades, label="Number of Trades")
+    plt.plot([i for i in range(1, tracker.n + 1)], euros, label="Euro Traded Volume")
+    plt.plot([i for i in range(1, tracker.n + 1)], dollars, label="Dollar Traded Volume")
     plt.xlabel("Number of Model Instances Run")
     plt.ylabel("Correlation with Spread")
     plt.figlegend(loc="upper right")
@@ -115,4 +72,4 @@ if __name__ == "__main__":
     training_path = "./data/year_2020_tick_data.csv"; run_path = "./data/year_2021_tick_data.csv"
     # hyperparameter_tune_banks(30, 50, 10, training_path, run_path)
     # hyperparameter_tune_traders(10, 100, 10, training_path, run_path)
-    hyperparameter_tune_runs(10, 5, 10, training_path, run_path)
\ No newline at end of file
+    hyperparameter_tune_runs(10, 5, 10, training_path, run_path)
@@ -0,0 +1,86 @@
+import numpy as np
+
+class Ledger:
+    """Balances in every currency for every agent in a model, one dense NumPy column per currency.
+
+    Agents are registered once and get an integer account index. Transfers can be
+    posted a batch at a time and are netted per account before they are applied.
+    The first two currencies are always EUR and USD, reachable as eur and usd.
+    """
+    def __init__(self, currencies=("EUR", "USD"), capacity=64):
+        self.index = {} # unique_id -> account index
+        self.size = 0
+        self.currencies = list(currencies)
+        self.columns = [np.zeros(capacity) for currency in self.currencies]
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def eur(self):
+        return self.columns[0]
+
+    @property
+    def usd(self):
+        return self.columns[1]
+
+    def column(self, currency):
+        return self.columns[self.currencies.index(currency)]
+
+    def register(self, unique_id, *amounts) -> int:
+        """Opens an account with the given starting amount of each currency, in ledger order."""
+        if self.size == len(self.columns[0]): # grow geometrically so registering n agents stays O(n)
+            self.columns = [np.concatenate([column, np.zeros(len(column))]) for column in self.columns]
+        account = self.size
+        self.index[unique_id] = account
+        for column, amount in zip(self.columns, amounts):
+            column[account] = amount
+        self.size += 1
+        return account
+
+    @property
+    def EUR(self):
+        return self.eur[:self.size]
+
+    @property
+    def USD(self):
+        return self.usd[:self.size]
+
+    def accounts(self, unique_ids):
+        return np.fromiter((self.index[unique_id] for unique_id in unique_ids), dtype=np.int64, count=len(unique_ids))
+
+    def transfer(self, buyers, sellers, euros, dollars, base=0, quote=1):
+        """Move euros from sellers to buyers and dollars from buyers to sellers, netted per account.
+
+        base and quote pick other ledger columns for the two legs of a different pair.
+        """
+        if len(buyers) == 0:
+            return
+        n = self.size
+        self.columns[base][:n] += np.bincount(buyers, euros, minlength=n) - np.bincount(sellers, euros, minlength=n)
+        self.columns[quote][:n] += np.bincount(sellers, dollars, minlength=n) - np.bincount(buyers, dollars, minlength=n)
+
+class LedgerAccount:
+    """Mixin giving an agent EUR/USD attributes that are views onto the model's ledger."""
+    def open_account(self, eur, usd):
+        """Other currencies start with the value of the dollars, see FXModel.endowment."""
+        self.account = self.model.ledger.register(self.unique_id, *self.model.endowment(eur, usd))
+
+    def balance(self, currency):
+        return self.model.ledger.column(currency)[self.account]
+
+    @property
+    def EUR(self):
+        return self.model.ledger.eur[self.account]
+
+    @EUR.setter
+    def EUR(self, value):
+        self.model.ledger.eur[self.account] = value
+
+    @property
+    def USD(self):
+        return self.model.ledger.usd[self.account]
+
+    @USD.setter
+    def USD(self, value):
+        self.model.ledger.usd[self.account] = value
@@ -0,0 +1,255 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from metrics import COLUMNS
+
+class MetricsBuffer:
+    """Per-step metric rows in memory-mapped files that another process can read while they are written.
+
+    The model's MetricsRecorder appends each row and then bumps the row count,
+    so a reader attached to the same directory only ever sees complete rows.
+    Pickling only carries the directory, like SharedMarketData.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "columns.json")) as columns_file:
+            self.columns = json.load(columns_file)
+        self.values = None
+        self.size = None
+
+    @classmethod
+    def create(cls, capacity, columns=COLUMNS, directory=None):
+        if directory is None and os.path.isdir("/dev/shm"):
+            directory = "/dev/shm"
+        directory = tempfile.mkdtemp(prefix="fx_live_", dir=directory)
+        np.lib.format.open_memmap(os.path.join(directory, "values.npy"), mode="w+", dtype=np.float64, shape=(max(capacity, 1), len(columns)))
+        np.lib.format.open_memmap(os.path.join(directory, "size.npy"), mode="w+", dtype=np.int64, shape=(1,))
+        with open(os.path.join(directory, "columns.json"), "w") as columns_file:
+            json.dump(list(columns), columns_file)
+        return cls(directory)
+
+    def open(self):
+        if self.values is None:
+            self.values = np.load(os.path.join(self.directory, "values.npy"), mmap_mode="r+")
+            self.size = np.load(os.path.join(self.directory, "size.npy"), mmap_mode="r+")
+
+    def __len__(self):
+        self.open()
+        return int(self.size[0])
+
+    def append(self, row):
+        self.open()
+        size = int(self.size[0])
+        if size < len(self.values): # a buffer sized for the model's steps only runs out if the model is stepped past its data
+            self.values[size] = row
+            self.size[0] = size + 1 # published after the row is written
+
+    def read(self, since=0):
+        """Copy of the rows written since row since."""
+        self.open()
+        return np.array(self.values[since:int(self.size[0])])
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __getstate__(self):
+        return {"directory": self.directory, "columns": self.columns, "values": None, "size": None}
+
+def extremes(rows, start, width):
+    """(min value, min index, max value, max index) of every column in consecutive blocks of width rows starting at row start."""
+    blocks = rows.reshape(-1, width, rows.shape[1])
+    offsets = start + np.arange(len(blocks))[:, None] * width
+    low, high = blocks.argmin(axis=1), blocks.argmax(axis=1)
+    return (np.take_along_axis(blocks, low[:, None], axis=1)[:, 0], offsets + low,
+        np.take_along_axis(blocks, high[:, None], axis=1)[:, 0], offsets + high)
+
+def combine(first, second):
+    """Extremes of two adjacent runs of rows, the earlier one winning ties."""
+    low = second[0] < first[0]
+    high = second[2] > first[2]
+    return (np.where(low, second[0], first[0]), np.where(low, second[1], first[1]),
+        np.where(high, second[2], first[2]), np.where(high, second[3], first[3]))
+
+class MinMaxDecimator:
+    """A bounded min/max envelope of a growing multi-column series.
+
+    Rows are folded into buckets of width rows that keep each column's minimum
+    and maximum and where they occurred. Whenever there would be more than
+    max_buckets buckets the width doubles and neighbouring buckets merge, so
+    every spike stays visible however long the run gets, while the number of
+    points drawn stays under 2 * max_buckets per column.
+    """
+    def __init__(self, num_columns, max_buckets=1000):
+        self.num_columns = num_columns
+        self.max_buckets = max_buckets
+        self.width = 1
+        self.count = 0 # rows folded in
+        self.buckets = tuple(np.zeros((0, num_columns), dtype=dtype) for dtype in (np.float64, np.int64, np.float64, np.int64)) # complete buckets
+        self.tail = None # extremes of the rows of the open bucket
+        self.tail_rows = 0
+
+    def add(self, rows):
+        if len(rows) == 0:
+            return
+        position = 0
+        if self.tail_rows: # top up the open bucket first
+            taken = min(self.width - self.tail_rows, len(rows))
+            self.fold_tail(rows[:taken], self.count)
+            position = taken
+        full = (len(rows) - position) // self.width * self.width
+        if full:
+            block = extremes(rows[position:position + full], self.count + position, self.width)
+            self.buckets = tuple(np.concatenate([old, new]) for old, new in zip(self.buckets, block))
+            position += full
+        if position < len(rows):
+            self.fold_tail(rows[position:], self.count + position)
+        self.count += len(rows)
+        while len(self.buckets[0]) > self.max_buckets:
+            self.coarsen()
+
+    def fold_tail(self, rows, start):
+        block = tuple(column[0] for column in extremes(rows, start, len(rows)))
+        self.tail = block if self.tail is None else combine(self.tail, block)
+        self.tail_rows += len(rows)
+        if self.tail_rows == self.width:
+            self.buckets = tuple(np.concatenate([old, new[None]]) for old, new in zip(self.buckets, self.tail))
+            self.tail, self.tail_rows = None, 0
+
+    def coarsen(self):
+        pairs = len(self.buckets[0]) // 2
+        merged = combine(tuple(column[0:2 * pairs:2] for column in self.buckets), tuple(column[1:2 * pairs:2] for column in self.buckets))
+        leftover = tuple(column[2 * pairs:] for column in self.buckets)
+        # an unpaired last bucket becomes the first half of the new open bucket
+        if len(leftover[0]):
+            leftover = tuple(column[0] for column in leftover)
+            self.tail = leftover if self.tail is None else combine(leftover, self.tail)
+            self.tail_rows += self.width
+        self.buckets = merged
+        self.width *= 2
+
+    @staticmethod
+    def points(extremes):
+        """Per column x and y lists, each bucket contributing its minimum and maximum in the order they occurred."""
+        low_value, low_index, high_value, high_index = extremes
+        first = low_index <= high_index
+        x = np.stack([np.where(first, low_index, high_index), np.where(first, high_index, low_index)], axis=1)
+        y = np.stack([np.where(first, low_value, high_value), np.where(first, high_value, low_value)], axis=1)
+        return [{"x": x[:, :, i].ravel().tolist(), "y": y[:, :, i].ravel().tolist()} for i in range(x.shape[2])]
+
+    def update(self, width, buckets):
+        """What a client holding buckets complete buckets of width width is missing, or everything if its width is stale."""
+        reset = width != self.width or buckets > len(self.buckets[0])
+        start = 0 if reset else buckets
+        tail = None
+        if self.tail is not None:
+            tail = self.points(tuple(column[None] for column in self.tail))
+        return {"width": self.width, "buckets": len(self.buckets[0]), "rows": self.count, "reset": reset,
+            "series": self.points(tuple(column[start:] for column in self.buckets)), "tail": tail}
+
+class LiveFeed:
+    """Reads new rows from a MetricsBuffer into a MinMaxDecimator whenever a client polls."""
+    def __init__(self, buffer, max_buckets=1000):
+        self.buffer = buffer
+        self.decimator = MinMaxDecimator(len(buffer.columns), max_buckets)
+        self.lock = threading.Lock()
+
+    def update(self, width, buckets):
+        with self.lock:
+            self.decimator.add(self.buffer.read(self.decimator.count))
+            update = self.decimator.update(width, buckets)
+        update["columns"] = self.buffer.columns
+        return update
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Foreign Exchange Model</title>
+<style>body{font-family:sans-serif;margin:20px}canvas{border:1px solid #ccc;margin:4px 0;display:block}</style></head>
+<body><h3>Foreign Exchange Model <span id="rows"></span></h3><div id="charts"></div>
+<script>
+const charts = [["Bid", "Offer"], ["Spread"], ["Trades"], ["EUR Volume", "USD Volume"]];
+const colours = ["black", "red"];
+let width = 0, buckets = 0, series = null, tail = null, columns = null;
+function draw() {
+  const container = document.getElementById("charts");
+  charts.forEach((names, c) => {
+    let canvas = document.getElementById("chart" + c);
+    if (!canvas) { canvas = document.createElement("canvas"); canvas.id = "chart" + c; canvas.width = 1000; canvas.height = 160; container.appendChild(canvas); }
+    const ctx = canvas.getContext("2d");
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    const lines = names.map(name => { const i = columns.indexOf(name), s = series[i], t = tail ? tail[i] : {x: [], y: []};
+      return {x: s.x.concat(t.x), y: s.y.concat(t.y)}; });
+    let xMax = 1, yMin = Infinity, yMax = -Infinity;
+    lines.forEach(l => { l.x.forEach(x => xMax = Math.max(xMax, x)); l.y.forEach(y => { yMin = Math.min(yMin, y); yMax = Math.max(yMax, y); }); });
+    if (yMax === yMin) { yMax += 1; yMin -= 1; }
+    ctx.fillText(names.join(", ") + "  " + yMin.toPrecision(5) + " - " + yMax.toPrecision(5), 5, 12);
+    lines.forEach((l, n) => {
+      ctx.strokeStyle = colours[n]; ctx.beginPath();
+      l.x.forEach((x, j) => { const px = x / xMax * (canvas.width - 10) + 5, py = canvas.height - 5 - (l.y[j] - yMin) / (yMax - yMin) * (canvas.height - 25);
+        j ? ctx.lineTo(px, py) : ctx.moveTo(px, py); });
+      ctx.stroke();
+    });
+  });
+}
+async function poll() {
+  try {
+    const update = await (await fetch("data?width=" + width + "&buckets=" + buckets)).json();
+    columns = update.columns;
+    if (update.reset || !series) series = update.series;
+    else update.series.forEach((s, i) => { series[i].x.push(...s.x); series[i].y.push(...s.y); });
+    width = update.width; buckets = update.buckets; tail = update.tail;
+    document.getElementById("rows").textContent = "(" + update.rows + " steps)";
+    draw();
+  } catch (e) {}
+  setTimeout(poll, 500);
+}
+poll();
+</script></body></html>
+"""
+
+def serve(buffer, port=8521, max_buckets=1000):
+    """Serves a live chart of a MetricsBuffer on localhost until interrupted.
+
+    The page polls for the points added since its last update, so each poll
+    sends O(new steps) data rather than the whole history.
+    """
+    feed = LiveFeed(buffer, max_buckets)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/data":
+                query = parse_qs(url.query)
+                body = json.dumps(feed.update(int(query.get("width", ["0"])[0]), int(query.get("buckets", ["0"])[0]))).encode()
+                content_type = "application/json"
+            else:
+                body, content_type = PAGE.encode(), "text/html"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print("Serving http://127.0.0.1:" + str(port) + " from " + buffer.directory)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def run_live(num_banks, num_traders, training_data, running_data, seed, buffer):
+    """Runs one model to the end at full speed, publishing every collected row to buffer. Meant for a separate process."""
+    from model import FXModel
+    from regression import generate_linear_model_params
+    model = FXModel(num_banks, num_traders, generate_linear_model_params(training_data), running_data, seed=seed)
+    model.datacollector.buffer = buffer
+    for i in range(model.max_steps - 1):
+        model.step()
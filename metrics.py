@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["Bid", "Offer", "Spread", "Trades", "USD Volume", "EUR Volume", "Clearing Price", "Matched Quantity", "Matches"]
+
+class MetricsRecorder:
+    """Per-step model metrics in preallocated NumPy columns.
+
+    Drop-in for the Mesa DataCollector the model used to have: collect() is
+    called once per step, model_vars and get_model_vars_dataframe() expose the
+    same reporters. Averages come straight from the model's bank rate arrays,
+    activity columns are deltas of the running totals since the previous collect
+    and the CDA columns are the book's totals for the last settled batch.
+    """
+    def __init__(self, capacity):
+        self.values = np.zeros((max(capacity, 1), len(COLUMNS)))
+        self.size = 0
+        self.totals = np.zeros(3) # trades, usd volume, eur volume at the previous collect
+        self.buffer = None # a live.MetricsBuffer also gets every row as it is collected
+
+    def __len__(self):
+        return self.size
+
+    def collect(self, model):
+        if self.size == len(self.values):
+            self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+        if len(model.bank_bids) != 0:
+            bid, offer = model.bank_bids.mean(), model.bank_offers.mean()
+            spread = np.abs(model.bank_offers - model.bank_bids).mean() / 0.0001 # spread in pips
+        else:
+            bid, offer = model.data.iat[0,0], model.data.iat[0,1]
+            spread = abs(offer - bid) / 0.0001
+        totals = np.array([model.num_trades, model.usd_volume, model.eur_volume], dtype=np.float64)
+        row = self.values[self.size]
+        row[0:3] = bid, offer, spread
+        row[3:6] = totals - self.totals
+        row[6:9] = model.CDA.last_clearing_price, model.CDA.last_matched_quantity, model.CDA.last_match_count
+        self.totals = totals
+        self.size += 1
+        if self.buffer is not None:
+            self.buffer.append(row)
+
+    @property
+    def model_vars(self):
+        return {name: self.values[:self.size, i] for i, name in enumerate(COLUMNS)}
+
+    def get_model_vars_dataframe(self):
+        return pd.DataFrame(self.values[:self.size], columns=COLUMNS)
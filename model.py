@@ -1,91 +1,108 @@
 from mesa import Agent, Model
 from mesa.time import RandomActivation
-from mesa.datacollection import DataCollector
-from CDA import CDA, Order
-from data import DataReader
+from data import BarFeed, DataReader, SharedMarketData
+from ledger import Ledger, LedgerAccount
+from metrics import MetricsRecorder
+from pairs import PairBooks, PairRegistry
+from population import TraderPopulation
+from rng import RandomBlocks, seed_sequence
+from tape import VENUE_CDA
+import numpy as np
 import random
 
-class BankAgent(Agent):
+class BankAgent(LedgerAccount, Agent):
     """ An agent with fixed initial wealth."""
-    def __init__(self, unique_id, model):
+    def __init__(self, unique_id, model, bank_index):
         super().__init__(unique_id, model)
-        self.EUR = 10000000000 # 10 billion
-        self.USD = 10000000000
+        self.bank_index = bank_index # position in the model's bank rate arrays
+        self.open_account(10000000000, 10000000000) # 10 billion each
         self.bid = self.model.data.iat[0, 0] # exchange rate is always as EURUSD
         self.offer = self.model.data.iat[0, 1]
-        self.rate_offset = random.normalvariate(0.0001, 0.00002)
+        self.rate_offsets = [self.model.draws.normal(0.0001, 0.00002)]
+        for pair in range(1, len(self.model.pairs)): # other pairs quote about a pip of their own away
+            pip = self.model.pairs[pair].pip
+            self.rate_offsets.append(self.model.draws.normal(pip, pip / 5))
+            self.model.pair_bids[pair, self.bank_index] = self.model.pair_data[pair].iat[0, 0]
+            self.model.pair_offers[pair, self.bank_index] = self.model.pair_data[pair].iat[0, 1]
+
+    @property
+    def rate_offset(self):
+        return self.rate_offsets[0]
+
+    @rate_offset.setter
+    def rate_offset(self, value):
+        self.rate_offsets[0] = value
+
+    @property
+    def bid(self):
+        return self.model.bank_bids[self.bank_index]
+
+    @bid.setter
+    def bid(self, value):
+        self.model.bank_bids[self.bank_index] = value
+
+    @property
+    def offer(self):
+        return self.model.bank_offers[self.bank_index]
+
+    @offer.setter
+    def offer(self, value):
+        self.model.bank_offers[self.bank_index] = value
 
     def cda_trade(self):
-        self.model.CDA.match_orders()
-        for match in self.model.CDA.matches:
-            if match.Bid.CreatorID == self.unique_id:
-                self.model.num_trades += 1
-                if match.Bid.currency == 0: # euros
-                    price = self.model.CDA.compute_clearing_price()
-                    self.EUR += match.Offer.Quantity # buying euros from counterparty
-                    self.USD -= int(match.Offer.Quantity * price) # exchanging dollars for counterparty's euros
-                    self.model.usd_volume += abs(int(match.Offer.Quantity * price))
-                    self.model.eur_volume += abs(match.Offer.Quantity)
-                    for agent in self.model.schedule.agents:
-                        if agent.unique_id == match.Offer.CreatorID:
-                            agent.EUR -= match.Offer.Quantity
-                            agent.USD += int(match.Offer.Quantity * price)
-                elif match.Bid.currency == 1: # dollars
-                    # maybe set clearing price as new exchange rate to see how that works
-                    price = self.model.CDA.compute_clearing_price()
-                    self.EUR -= int(match.Offer.Quantity * (1 / price)) # selling euros to counterparty
-                    self.USD += match.Offer.Quantity # getting back dollars from counterparty
-                    self.model.usd_volume += abs(match.Offer.Quantity)
-                    self.model.eur_volume += abs(int(match.Offer.Quantity * (1 / price)))
-                    for agent in self.model.schedule.agents:
-                        if agent.unique_id == match.Offer.CreatorID:
-                            agent.EUR += int(match.Offer.Quantity * (1 / price))
-                            agent.USD -= match.Offer.Quantity
-                self.model.CDA.matches.remove(match)
+        # matches are settled by the model in one netted batch at the end of the step
+        self.model.pair_books.match()
         
-    def cda_random_trade(self):
-        rnd = random.random()
+    def cda_random_trade(self, pair=0):
+        # euros and dollars are the base and quote currency of the pair, EURUSD for the primary one
+        rnd = self.model.draws.uniform()
         trade_portion = self.model.max_steps
-        euros = random.random() * self.EUR/trade_portion
-        dollars = random.random() * self.USD/trade_portion
+        base, quote = self.model.pair_currencies[pair]
+        euros = self.model.draws.uniform() * self.model.ledger.columns[base][self.account]/trade_portion
+        dollars = self.model.draws.uniform() * self.model.ledger.columns[quote][self.account]/trade_portion * self.model.pair_scales[pair]
+        bid, offer = self.model.pair_bids[pair, self.bank_index], self.model.pair_offers[pair, self.bank_index]
         if rnd < 0.5:
-            sellEuroOrder = Order(self.unique_id, True, int(euros), self.offer, 0)
-            self.model.CDA.add_order(sellEuroOrder)
-            sellDollarOrder = Order(self.unique_id, True, int(dollars), self.offer, 0)
-            self.model.CDA.add_order(sellDollarOrder)
+            self.model.pair_books.submit(pair, self.unique_id, True, int(euros), offer, 0) # sell euros
+            self.model.pair_books.submit(pair, self.unique_id, True, int(dollars), offer, 0) # sell dollars
         else:
-            buyEuroOrder = Order(self.unique_id, False, int(euros), self.bid, 0)
-            self.model.CDA.add_order(buyEuroOrder)
-            buyDollarOrder = Order(self.unique_id, False, int(dollars), self.bid, 0)
-            self.model.CDA.add_order(buyDollarOrder)
+            self.model.pair_books.submit(pair, self.unique_id, False, int(euros), bid, 0) # buy euros
+            self.model.pair_books.submit(pair, self.unique_id, False, int(dollars), bid, 0) # buy dollars
  
-    def cda_reactive_trade(self):
-        spread_in_pips = abs(self.bid - self.offer) / 0.0001
-        probability = self.model.get_trade_probability(spread_in_pips)
-        if random.random() < probability:
-            self.cda_random_trade()
+    def cda_reactive_trade(self, pair=0):
+        spread = abs(self.model.pair_bids[pair, self.bank_index] - self.model.pair_offers[pair, self.bank_index])
+        probability = self.model.get_trade_probability(spread / self.model.pairs[pair].pip)
+        if self.model.draws.uniform() < probability:
+            self.cda_random_trade(pair)
     
+    def update_rates(self, bid, offer, pair=0):
+        self.model.pair_bids[pair, self.bank_index] = bid + self.rate_offsets[pair]
+        self.model.pair_offers[pair, self.bank_index] = offer + self.rate_offsets[pair]
+
+    def lookup_rates(self):
+        # every pair's market rates at the current step
+        for pair, data in enumerate(self.model.pair_data):
+            self.update_rates(data.iat[self.model.current_step, 0], data.iat[self.model.current_step, 1], pair)
+
     def step(self):
-        self.bid = self.model.data.iat[self.model.current_step, 0] + self.rate_offset
-        self.offer = self.model.data.iat[self.model.current_step, 1] + self.rate_offset
-        self.cda_reactive_trade()
+        self.lookup_rates()
+        for pair in range(len(self.model.pair_books)):
+            self.cda_reactive_trade(pair)
         self.cda_trade()
         
 
-class Trader(Agent):
+class Trader(LedgerAccount, Agent):
     """ An agent with fixed initial wealth."""
     def __init__(self, unique_id, model, bank):
         super().__init__(unique_id, model)
         self.bank = bank
-        self.EUR = 100000000 # 100 million 
-        self.USD = 100000000
+        self.open_account(100000000, 100000000) # 100 million each
 
     def sell_side_trade(self):
-        rnd = random.random()
+        rnd = self.model.draws.uniform()
         trade_portion = self.model.max_steps
         other = self.model.traders[round(rnd * (len(self.model.traders) - 1))]
-        euros = random.random() * self.EUR/trade_portion
-        dollars = random.random() * self.USD/trade_portion
+        euros = self.model.draws.uniform() * self.EUR/trade_portion
+        dollars = self.model.draws.uniform() * self.USD/trade_portion
         if rnd < 0.5: # sell eur
             dollars_back = euros * self.bank.offer
             other.EUR += euros
@@ -95,6 +112,8 @@ class Trader(Agent):
             self.model.usd_volume += abs(dollars_back)
             self.model.eur_volume += abs(euros)
             self.model.num_trades += 1
+            if self.model.tape is not None:
+                self.model.tape.record(self.model.current_step, other.account, self.account, 0, euros, self.bank.offer)
         else: # sell usd
             euros_back = dollars * (1 / self.bank.offer)
             other.USD += dollars
@@ -104,13 +123,15 @@ class Trader(Agent):
             self.model.usd_volume += abs(dollars)
             self.model.eur_volume += abs(euros_back)
             self.model.num_trades += 1
+            if self.model.tape is not None:
+                self.model.tape.record(self.model.current_step, other.account, self.account, 1, dollars, self.bank.offer)
 
     def buy_side_trade(self):
-        rnd = random.random()
+        rnd = self.model.draws.uniform()
         trade_portion = self.model.max_steps
         other = self.model.traders[round(rnd * (len(self.model.traders) - 1))]
-        euros = random.random() * self.EUR/trade_portion
-        dollars = random.random() * self.USD/trade_portion
+        euros = self.model.draws.uniform() * self.EUR/trade_portion
+        dollars = self.model.draws.uniform() * self.USD/trade_portion
         if rnd < 0.5: # buy eur
             dollars_sent = euros * self.bank.bid
             other.EUR -= euros
@@ -120,6 +141,8 @@ class Trader(Agent):
             self.model.usd_volume += abs(dollars_sent)
             self.model.eur_volume += abs(euros)
             self.model.num_trades += 1
+            if self.model.tape is not None:
+                self.model.tape.record(self.model.current_step, self.account, other.account, 0, euros, self.bank.bid)
         else: # buy usd
             euros_sent = dollars * (1 / self.bank.bid)
             other.USD -= dollars
@@ -129,9 +152,11 @@ class Trader(Agent):
             self.model.usd_volume += abs(dollars)
             self.model.eur_volume += abs(euros_sent)
             self.model.num_trades += 1
+            if self.model.tape is not None:
+                self.model.tape.record(self.model.current_step, self.account, other.account, 1, dollars, self.bank.bid)
     
     def random_trade(self):
-        if random.random() < 0.5:
+        if self.model.draws.uniform() < 0.5:
             self.buy_side_trade()
         else:
             self.sell_side_trade()
@@ -139,7 +164,7 @@ class Trader(Agent):
     def reactive_trade(self):
         spread_in_pips = abs(self.bank.bid - self.bank.offer) / 0.0001
         probability = self.model.get_trade_probability(spread_in_pips)
-        if random.random() < probability:
+        if self.model.draws.uniform() < probability:
             self.random_trade()
 
     def step(self):
@@ -150,35 +175,120 @@ class Trader(Agent):
 
 class FXModel(Model):
     """FX model with CDA mechanism"""
-    def __init__(self, NumBanks, NumTraders, Linear_Model, running_data_path):
+    def __init__(self, NumBanks, NumTraders, Linear_Model, running_data_path, population=False, seed=None):
         self.num_banks = NumBanks
         self.num_traders = NumTraders
+        self.population = population # step each bank's traders as one vectorized TraderPopulation
+        self.reseed(seed)
         self.schedule = RandomActivation(self)
         self.running = True
-        self.CDA = CDA()
-        self.data = DataReader(running_data_path).get_hour_data()
-        self.max_steps = len(self.data.index) # number of data rows = max number of model steps
+        # a PairRegistry trades several pairs at once, anything else is EURUSD data on its own
+        self.pairs = running_data_path if isinstance(running_data_path, PairRegistry) else PairRegistry([("EURUSD", running_data_path)])
+        self.pair_data = [self.open_market_data(pair.data) for pair in self.pairs]
+        self.data = self.pair_data[0]
+        self.pair_books = PairBooks(len(self.pairs))
+        self.CDA = self.pair_books[0]
+        self.ledger = Ledger(self.pairs.currencies)
+        self.pair_currencies = [(self.pairs.currency_index(pair.base), self.pairs.currency_index(pair.quote)) for pair in self.pairs]
+        self.currency_values = self.value_currencies()
+        # orders are quantities of the base currency, so quote amounts are scaled by the starting balance ratio (1 for EURUSD)
+        units = self.endowment(1, 1)
+        self.pair_scales = [units[base] / units[quote] for base, quote in self.pair_currencies]
+        self.creator_accounts = [np.zeros(0, dtype=np.int64) for pair in self.pairs]
+        self.max_steps = min(len(data.index) for data in self.pair_data) # number of data rows = max number of model steps
         self.num_trades = 0
         self.current_step = 0
-        self.trades = [0]
         self.eur_volume = 0
         self.usd_volume = 0
-        self.usd_volumes = [0]
-        self.eur_volumes = [0]
+        self.pair_trades = np.zeros(len(self.pairs), dtype=np.int64) # CDA trades and base/quote volume of each pair
+        self.pair_volumes = np.zeros((len(self.pairs), 2))
+        self.pair_bids = np.zeros((len(self.pairs), self.num_banks))
+        self.pair_offers = np.zeros((len(self.pairs), self.num_banks))
+        self.bank_bids = self.pair_bids[0] # the primary pair's rates
+        self.bank_offers = self.pair_offers[0]
         self.params = Linear_Model
+        self.profiler = None # a profiling.StepProfiler to time each phase of step
+        self.tape = None # a tape.TradeTape to record every executed trade
         # Create agents
         for i in range(self.num_banks):
-            bank = BankAgent("bank" + str(i), self)
+            bank = BankAgent("bank" + str(i), self, i)
             self.schedule.add(bank)
             # buy and sell agents should belong to the bank
+            if self.population:
+                self.schedule.add(TraderPopulation("population" + bank.unique_id, self, bank, self.num_traders))
+                continue
             for i in range(self.num_traders):
                 trader = Trader("trader" + str(i) + bank.unique_id, self, bank)
                 self.schedule.add(trader)
-        self.datacollector = DataCollector(
-            model_reporters={"Bid": average_bid, "Offer": average_offer, "Spread": average_spread, "Trades": num_trades, "USD Volume": usd_volume, "EUR Volume": eur_volume}
-        )
+        self.datacollector = MetricsRecorder(self.max_steps)
 
         self.traders = [agent for agent in self.schedule.agents if agent.unique_id.startswith("trader")]
+        self.bank_accounts = self.ledger.accounts([agent.unique_id for agent in self.schedule.agents if agent.unique_id.startswith("bank")])
+        self.trader_accounts = self.ledger.accounts([unique_id for unique_id in self.ledger.index if unique_id.startswith("trader")])
+
+    def reseed(self, seed):
+        """Every random draw in the model, including activation order, comes from the stream for this seed."""
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else seed_sequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+        self.random = random.Random(int(self.seed_sequence.generate_state(1, np.uint64)[0]))
+        self.draws = RandomBlocks(self.rng)
+
+    @staticmethod
+    def open_market_data(source):
+        # a SharedMarketData published by the batch runner is mapped instead of re-reading the csv,
+        # and a BarFeed streams hourly bars as the steps ask for them
+        if isinstance(source, SharedMarketData):
+            return source.frame()
+        if isinstance(source, BarFeed):
+            return source
+        return DataReader(source).get_hour_data()
+
+    def value_currencies(self):
+        """Dollar value of every currency at the first bar, chained through the pairs."""
+        values = {"USD": 1.0}
+        if len(self.pairs.currencies) == 2:
+            return values # only EUR and USD, whose endowments are fixed
+        changed = True
+        while changed:
+            changed = False
+            for pair, data in zip(self.pairs, self.pair_data):
+                rate = (data.iat[0, 0] + data.iat[0, 1]) / 2
+                if pair.quote in values and pair.base not in values:
+                    values[pair.base] = rate * values[pair.quote]
+                    changed = True
+                elif pair.base in values and pair.quote not in values:
+                    values[pair.quote] = values[pair.base] / rate
+                    changed = True
+        missing = [currency for currency in self.pairs.currencies[2:] if currency not in values]
+        if missing:
+            raise ValueError("No pair links " + ", ".join(missing) + " to USD")
+        return values
+
+    def endowment(self, eur, usd):
+        """Starting balances in ledger order: eur and usd as given, other currencies worth as much as the dollars."""
+        return (eur, usd) + tuple(usd / self.currency_values[currency] for currency in self.pairs.currencies[2:])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["data"]
+        del state["bank_bids"], state["bank_offers"] # views of pair_bids and pair_offers, which pickling would copy
+        state["tape"] = None # a copy has no file to write to
+        # workers re-map shared files instead of receiving a copy
+        state["pair_data"] = [None if isinstance(pair.data, SharedMarketData) else data for pair, data in zip(self.pairs, self.pair_data)]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pair_data = [self.open_market_data(pair.data) if data is None else data for pair, data in zip(self.pairs, self.pair_data)]
+        self.data = self.pair_data[0]
+        self.bank_bids = self.pair_bids[0]
+        self.bank_offers = self.pair_offers[0]
+
+    def bank_balances(self):
+        return self.ledger.eur[self.bank_accounts], self.ledger.usd[self.bank_accounts]
+
+    def trader_balances(self):
+        return self.ledger.eur[self.trader_accounts], self.ledger.usd[self.trader_accounts]
     
     def get_trade_probability(self, x):
         p = float(self.params[0]) * x + float(self.params[1])
@@ -190,46 +300,37 @@ class FXModel(Model):
             return p
 
     def step(self):
+        if self.profiler is not None:
+            return self.profiler.profile_step(self)
         self.datacollector.collect(self)
-        self.trades.append(self.num_trades)
-        self.eur_volumes.append(self.eur_volume)
-        self.usd_volumes.append(self.usd_volume)
         self.current_step += 1
         self.schedule.step()
+        self.settle_matches()
 
-def eur_volume(model):
-    return model.eur_volumes[-1] - model.eur_volumes[-2] if len(model.eur_volumes) > 1 else model.eur_volumes[-1]
-    
-def usd_volume(model):
-    return model.usd_volumes[-1] - model.usd_volumes[-2] if len(model.usd_volumes) > 1 else model.usd_volumes[-1]
-
-def num_trades(model):
-    return model.trades[-1] - model.trades[-2] if len(model.trades) > 1 else model.trades[-1]
-
-def average_bid(model):
-    rates = []
-    for agent in model.schedule.agents:
-        if agent.unique_id.startswith("bank"):
-            rates.append(agent.bid)
-    if len(rates) != 0:
-        return sum(rates)/len(rates)
-    return model.data.iat[0,0]
-
-def average_offer(model):
-    rates = []
-    for agent in model.schedule.agents:
-        if agent.unique_id.startswith("bank"):
-            rates.append(agent.offer)
-    if len(rates) != 0:
-        return sum(rates)/len(rates)
-    return model.data.iat[0,1]
-
-# spread in pips
-def average_spread(model):
-    spreads = []
-    for agent in model.schedule.agents:
-        if agent.unique_id.startswith("bank"):
-            spreads.append(abs(agent.offer - agent.bid))
-    if len(spreads) != 0:
-        return (sum(spreads)/len(spreads))/0.0001
-    return abs(model.data.iat[0,1] - model.data.iat[0,0])/0.0001
+    def settle_matches(self):
+        """Settle every CDA match from this step at its book's clearing price, one netted ledger update per pair."""
+        for pair, book in enumerate(self.pair_books.books):
+            price = book.compute_clearing_price()
+            matches = book.consume_matches()
+            if len(matches.quantity) == 0:
+                continue
+            if len(self.creator_accounts[pair]) < len(book.creators): # ledger account of each CDA creator code
+                self.creator_accounts[pair] = self.ledger.accounts(book.creators)
+            buyers = self.creator_accounts[pair][matches.buyers]
+            sellers = self.creator_accounts[pair][matches.sellers]
+            quantity = matches.quantity.astype(float)
+            in_dollars = matches.currency == 1
+            # buying euros pays int(quantity * price) dollars, buying dollars pays int(quantity / price) euros,
+            # with euros and dollars standing for the pair's base and quote currency
+            euros = np.where(in_dollars, -np.trunc(quantity / price), quantity)
+            dollars = np.where(in_dollars, -quantity, np.trunc(quantity * price))
+            self.ledger.transfer(buyers, sellers, euros, dollars, *self.pair_currencies[pair])
+            if self.tape is not None:
+                self.tape.extend(self.current_step, buyers, sellers, np.array(self.pair_currencies[pair])[matches.currency], matches.quantity, price, VENUE_CDA, pair)
+            euro_volume, dollar_volume = np.abs(euros).sum(), np.abs(dollars).sum()
+            self.pair_trades[pair] += len(quantity)
+            self.pair_volumes[pair] += euro_volume, dollar_volume
+            if pair == 0:
+                self.num_trades += len(quantity)
+                self.eur_volume += euro_volume
+                self.usd_volume += dollar_volume
@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+from typing import Dict, List
+from CDA import CDA
+
+@dataclass
+class CurrencyPair:
+    """One quoted pair. Rates are quote currency per unit of base currency, as in the HistData files."""
+    name: str # e.g. "EURUSD", base currency then quote currency
+    data: object # csv path, SharedMarketData or BarFeed of this pair's rates
+    pip: float = 0.0001
+
+    @property
+    def base(self):
+        return self.name[:3]
+
+    @property
+    def quote(self):
+        return self.name[3:]
+
+class PairRegistry:
+    """The pairs a model trades, in order.
+
+    The first pair is the primary one: its rates drive the model's metrics and
+    the traders' sell-side trades, as EURUSD does on its own. Every currency
+    gets a ledger column in the order it first appears, after EUR and USD.
+    Each new pair must share a currency with the ones before it, so every
+    currency can be valued from the first bar of the data.
+    """
+    def __init__(self, pairs=()):
+        self.pairs: List[CurrencyPair] = []
+        self.index: Dict[str, int] = {}
+        self.currencies = ["EUR", "USD"]
+        for name, data in pairs:
+            self.add(name, data)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __getitem__(self, key):
+        return self.pairs[self.index[key] if isinstance(key, str) else key]
+
+    def add(self, name, data, pip=None):
+        if name in self.index:
+            raise ValueError("Pair " + name + " is already registered")
+        pair = CurrencyPair(name, data, pip if pip is not None else (0.01 if name.endswith("JPY") else 0.0001))
+        if self.pairs and pair.base not in self.currencies and pair.quote not in self.currencies:
+            raise ValueError("Pair " + name + " shares no currency with the pairs registered before it")
+        for currency in (pair.base, pair.quote):
+            if currency not in self.currencies:
+                self.currencies.append(currency)
+        self.index[name] = len(self.pairs)
+        self.pairs.append(pair)
+        return pair
+
+    def currency_index(self, currency):
+        return self.currencies.index(currency)
+
+class PairBooks:
+    """One CDA per pair, matched one after another.
+
+    Orders go straight into their pair's book and each book is matched as its
+    orders arrive. Books never interact, so the result is the same in
+    whatever order the pairs are matched.
+    """
+    def __init__(self, num_pairs):
+        self.books = [CDA() for i in range(num_pairs)]
+
+    def __len__(self):
+        return len(self.books)
+
+    def __getitem__(self, pair):
+        return self.books[pair]
+
+    def submit(self, pair, creator_id, side, quantity, price, currency):
+        return self.books[pair].submit(creator_id, side, quantity, price, currency)
+
+    def match(self, pair=None):
+        """Matches one book, or every book when pair is None."""
+        for pair in range(len(self.books)) if pair is None else [pair]:
+            self.books[pair].match_orders()
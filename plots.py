@@ -0,0 +1,66 @@
+from argparse import ArgumentParser
+import matplotlib.pyplot as plt
+from results import STORE_DIR, ResultStore, config_key
+
+def plot_trader_wealth(trader_eur, trader_usd, path=None):
+    hist_fig, hist_axs = plt.subplots(2, sharex=True)
+    hist_fig.set_size_inches(7, 7)
+    hist_fig.text(0.5, 0.04, 'Currency Reserves', ha='center')
+    hist_fig.text(0.04, 0.5, 'Number of Agents', va='center', rotation='vertical')
+    hist_fig.suptitle("Trading Agent Currency Reserves")
+    hist_axs[0].hist(trader_eur, bins=100, color="green", label="Euros")
+    hist_axs[1].hist(trader_usd, bins=100, color="orange",label="Dollars")
+    hist_fig.legend(loc="upper right")
+    if path is not None:
+        hist_fig.savefig(path)
+    return hist_fig
+
+def plot_spread_activity(df, path=None):
+    """The cross-run mean bid/offer, spread and activity series of one configuration."""
+    fig, axs = plt.subplots(5, sharex=True)
+    fig.set_size_inches(11, 9)
+    fig.suptitle('Spread vs Trade Activity')
+    fig.text(0.5, 0.04, 'Model Step', ha='center')
+    axs[0].plot(df.index.tolist(), df['Bid'].tolist())
+    axs[0].plot(df.index.tolist(), df['Offer'].tolist())
+    axs[0].title.set_text("Bid and Offer")
+    axs[0].set_ylabel("Exchange Rate")
+    axs[1].plot(df.index.tolist(), df['Spread'].tolist())
+    axs[1].title.set_text("Spread")
+    axs[1].set_ylabel("Spread in Pips")
+    axs[2].plot(df.index.tolist(), df['Trades'].tolist())
+    axs[2].title.set_text("Trades")
+    axs[2].set_ylabel("Number of Trades")
+    axs[3].plot(df.index.tolist(), df['USD Volume'].tolist())
+    axs[3].title.set_text("USD Hourly Traded Volume")
+    axs[3].set_ylabel("Dollars")
+    axs[4].plot(df.index.tolist(), df['EUR Volume'].tolist())
+    axs[4].title.set_text("EUR Hourly Traded Volume")
+    axs[4].set_ylabel("Euros")
+    if path is not None:
+        fig.savefig(path)
+    return fig
+
+def plot_query(query, directory="./results"):
+    """Plots every configuration a ResultQuery selects, saving one graph per configuration key."""
+    means = query.means()
+    for config in query.configs():
+        key = config_key(config)
+        if key in means:
+            plot_spread_activity(means[key], directory + "/graphs_" + key + ".png")
+    trader_eur, trader_usd = query.balances()[2:]
+    if len(trader_eur):
+        plot_trader_wealth(trader_eur, trader_usd)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Plot and summarise stored runs without re-running them.")
+    parser.add_argument("--store", default=STORE_DIR, help= "The result store directory.")
+    parser.add_argument("-b", "--bank", type=int, help= "Only runs with this many banks.")
+    parser.add_argument("-t", "--trader", type=int, help= "Only runs with this many traders per bank.")
+    parser.add_argument("-s", "--seed", type=int, help= "Only runs of the batch with this seed.")
+    args = parser.parse_args()
+    filters = {name: value for name, value in (("num_banks", args.bank), ("num_traders", args.trader)) if value is not None}
+    query = ResultStore(args.store).query(args.seed, **filters)
+    print(query.correlations().to_string())
+    plot_query(query)
+    plt.show()
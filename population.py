@@ -0,0 +1,61 @@
+from mesa import Agent
+import numpy as np
+from tape import VENUE_SELL_SIDE
+
+class TraderPopulation(Agent):
+    """All of one bank's traders, stepped together as arrays.
+
+    Each trader still has its own ledger account, so balances are identical in
+    layout to per-agent mode. Every step draws the trade decision, side,
+    counterparty and size for the whole population in one pass, mirroring
+    Trader.reactive_trade -> random_trade -> buy/sell_side_trade.
+    """
+    def __init__(self, unique_id, model, bank, num_traders):
+        super().__init__(unique_id, model)
+        self.bank = bank
+        self.accounts = np.array([model.ledger.register("trader" + str(i) + bank.unique_id, *model.endowment(100000000, 100000000))
+            for i in range(num_traders)], dtype=np.int64) # 100 million each
+        self.active = np.ones(num_traders, dtype=bool)
+
+    @property
+    def EUR(self):
+        return self.model.ledger.eur[self.accounts]
+
+    @property
+    def USD(self):
+        return self.model.ledger.usd[self.accounts]
+
+    def step(self):
+        accounts = self.accounts[self.active]
+        if len(accounts) == 0:
+            return
+        ledger = self.model.ledger
+        eur, usd = ledger.eur[accounts], ledger.usd[accounts]
+        # traders with nothing left still get this step, like Trader.step, then drop out
+        self.active[self.active] = (eur > 0) | (usd > 0)
+
+        spread_in_pips = abs(self.bank.bid - self.bank.offer) / 0.0001
+        probability = self.model.get_trade_probability(spread_in_pips)
+        n = len(accounts)
+        trading = self.model.rng.random(n) < probability
+        buy_side = self.model.rng.random(n) < 0.5
+        rnd = self.model.rng.random(n)
+        euros = self.model.rng.random(n) * eur / self.model.max_steps
+        dollars = self.model.rng.random(n) * usd / self.model.max_steps
+
+        all_traders = self.model.trader_accounts
+        others = all_traders[np.rint(rnd * (len(all_traders) - 1)).astype(np.int64)]
+        in_euros = rnd < 0.5
+        rate = np.where(buy_side, self.bank.bid, self.bank.offer)
+        direction = np.where(buy_side, 1.0, -1.0) # buying gains the traded currency, selling gives it up
+        eur_leg = np.where(in_euros, direction * euros, -direction * dollars / rate)
+        usd_leg = np.where(in_euros, -direction * euros * rate, direction * dollars)
+
+        eur_leg, usd_leg = eur_leg[trading], usd_leg[trading]
+        ledger.transfer(accounts[trading], others[trading], eur_leg, -usd_leg)
+        self.model.num_trades += len(eur_leg)
+        self.model.eur_volume += np.abs(eur_leg).sum()
+        self.model.usd_volume += np.abs(usd_leg).sum()
+        if self.model.tape is not None: # buyers gain the traded currency, as on the Trader paths
+            self.model.tape.extend(self.model.current_step, np.where(buy_side, accounts, others)[trading], np.where(buy_side, others, accounts)[trading],
+                np.where(in_euros, 0, 1)[trading], np.where(in_euros, euros, dollars)[trading], rate[trading], VENUE_SELL_SIDE)
@@ -0,0 +1,108 @@
+from array import array
+from collections import defaultdict
+import time
+import numpy as np
+from model import BankAgent
+
+class StepProfiler:
+    """Wall time and call counts per phase of FXModel.step, plus book depth and matches per step.
+
+    Off unless assigned to model.profiler, in which case the model hands its
+    step to profile_step. Phases are "collect", "settle", "agents.<type>" for
+    each agent's whole step and "bank.data", "bank.quote", "bank.match_orders"
+    inside BankAgent.step. The random draws and their order are the same as an
+    unprofiled step, so profiling a run doesn't change its results.
+    """
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.depth = array("q") # resting orders after matching, per step
+        self.matches = array("q")
+        self.runs = 1
+
+    def add(self, phase, seconds):
+        self.seconds[phase] += seconds
+        self.calls[phase] += 1
+
+    def profile_step(self, model):
+        clock = time.perf_counter
+        start = clock()
+        model.datacollector.collect(model)
+        self.add("collect", clock() - start)
+        model.current_step += 1
+        schedule = model.schedule
+        # RandomActivation.step, with each activation timed
+        for agent in schedule.agent_buffer(shuffled=True):
+            start = clock()
+            if isinstance(agent, BankAgent):
+                self.profile_bank_step(agent)
+            else:
+                agent.step()
+            self.add("agents." + type(agent).__name__, clock() - start)
+        schedule.steps += 1
+        schedule.time += 1
+        books = model.pair_books
+        self.depth.append(sum(book.depth for book in books.books))
+        start = clock()
+        model.settle_matches()
+        self.add("settle", clock() - start)
+        self.matches.append(sum(book.last_match_count for book in books.books))
+
+    def profile_bank_step(self, bank):
+        # BankAgent.step split into its phases
+        clock = time.perf_counter
+        model = bank.model
+        start = clock()
+        bank.lookup_rates()
+        looked_up = clock()
+        for pair in range(len(model.pair_books)):
+            bank.cda_reactive_trade(pair)
+        quoted = clock()
+        bank.cda_trade()
+        self.add("bank.data", looked_up - start)
+        self.add("bank.quote", quoted - looked_up)
+        self.add("bank.match_orders", clock() - quoted)
+
+    def export(self):
+        """Plain, picklable and JSON-serialisable copy to send back from a worker."""
+        return {"runs": self.runs, "seconds": dict(self.seconds), "calls": dict(self.calls),
+            "depth": self.depth.tolist(), "matches": self.matches.tolist()}
+
+    @classmethod
+    def from_export(cls, exported):
+        profiler = cls()
+        profiler.runs = exported["runs"]
+        profiler.seconds.update(exported["seconds"])
+        profiler.calls.update(exported["calls"])
+        profiler.depth.extend(exported["depth"])
+        profiler.matches.extend(exported["matches"])
+        return profiler
+
+    @classmethod
+    def merge(cls, exports):
+        """One profile for a whole batch: times and calls summed, per-step samples pooled over every run."""
+        merged = cls()
+        merged.runs = 0
+        for exported in exports:
+            merged.runs += exported["runs"]
+            for phase, seconds in exported["seconds"].items():
+                merged.seconds[phase] += seconds
+            for phase, calls in exported["calls"].items():
+                merged.calls[phase] += calls
+            merged.depth.extend(exported["depth"])
+            merged.matches.extend(exported["matches"])
+        return merged
+
+    def summary(self):
+        """Human readable table of the phases, slowest first, then the book statistics."""
+        total = sum(seconds for phase, seconds in self.seconds.items() if "." not in phase or phase.startswith("agents."))
+        lines = ["{:<24} {:>10} {:>12} {:>12} {:>7}".format("Phase", "Seconds", "Calls", "us/call", "Share")]
+        for phase in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            seconds, calls = self.seconds[phase], self.calls[phase]
+            lines.append("{:<24} {:>10.3f} {:>12} {:>12.2f} {:>6.1f}%".format(phase, seconds, calls,
+                seconds / calls * 1e6, 100 * seconds / total if total else 0))
+        if len(self.depth):
+            depth, matches = np.frombuffer(self.depth, dtype=np.int64), np.frombuffer(self.matches, dtype=np.int64)
+            lines.append("Runs: {}, steps: {}, book depth mean {:.1f} max {}, matches per step mean {:.1f} max {}".format(
+                self.runs, len(depth), depth.mean(), depth.max(), matches.mean(), matches.max()))
+        return "\n".join(lines)
@@ -1,12 +1,34 @@
-from data import DataReader
-from sklearn.linear_model import LinearRegression
+import hashlib
+import json
+import os
+import numpy as np
+from data import DataReader, fingerprint
+
+# resampling settings the fitted parameters depend on, part of the cache key
+SPREAD_SETTINGS = {"unit": "six_hour", "max_spread": 20}
+
+def params_cache_path(training_data):
+    key = hashlib.sha1(json.dumps([fingerprint(training_data), SPREAD_SETTINGS], sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(training_data + ".cache", "linear_model_" + key + ".npz")
+
+def fit_linear_model(training_data):
+    from sklearn.linear_model import LinearRegression # only needed when the cache misses
+    spreads, probabilities = DataReader(training_data, stream=True).get_probability_table(SPREAD_SETTINGS["max_spread"])
+    reg = LinearRegression(fit_intercept=False).fit(spreads.reshape(-1, 1), probabilities.reshape(-1, 1))
+    return reg.coef_[0][0], spreads, probabilities
 
 def generate_linear_model_params(training_data):
     if training_data.lower() == "none": return 0, 1
-    prob_data = DataReader(training_data).get_probability_data()
-    X, y = [], []
-    for spread, probability in prob_data:
-        X.append([spread])
-        y.append([probability])
-    reg = LinearRegression(fit_intercept=False).fit(X, y)
-    return reg.coef_[0][0] * -1, 1.0
\ No newline at end of file
+    cache_path = params_cache_path(training_data)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            return float(cached["coef"]) * -1, 1.0
+    coef, spreads, probabilities = fit_linear_model(training_data)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp.npz"
+        np.savez(tmp_path, coef=coef, spreads=spreads, probabilities=probabilities)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass # read-only data directory, fit again next time
+    return coef * -1, 1.0
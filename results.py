@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+from convergence import ACTIVITY_COLUMNS, ConvergenceTracker
+from runner import RunResult
+
+STORE_DIR = "./results/store"
+RUN_FILE = re.compile(r"run(\d+)_(\d+)\.npz$") # run<id>_<seed>.npz
+
+def config_key(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+class ResultStore:
+    """Columnar on-disk store of finished runs, partitioned by configuration.
+
+    Each configuration gets a directory named by its key holding config.json
+    and one RunResult .npz per run, named by run id and batch seed. A run's
+    per-step metrics, final balances, summary (seed, timings, linear params),
+    metadata (dataset fingerprints) and profile all live in its own file, so
+    runs from any number of invocations accumulate side by side.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.seed = None # batch seed assumed when a run is looked up without one
+        os.makedirs(self.directory, exist_ok=True)
+
+    def config_dir(self, config):
+        return os.path.join(self.directory, config_key(config))
+
+    def run_path(self, config, run_id, seed=None):
+        seed = self.seed if seed is None else seed
+        return os.path.join(self.config_dir(config), "run" + str(run_id) + "_" + str(seed) + ".npz")
+
+    def has(self, config, run_id, seed=None):
+        return os.path.exists(self.run_path(config, run_id, seed))
+
+    def save(self, result):
+        config_dir = self.config_dir(result.config)
+        config_path = os.path.join(config_dir, "config.json")
+        if not os.path.exists(config_path): # the directory may already exist holding checkpoints
+            os.makedirs(config_dir, exist_ok=True)
+            with open(config_path, "w") as config_file:
+                json.dump(result.config, config_file)
+        result.save(self.run_path(result.config, result.run_id, result.summary["seed"]))
+
+    def load(self, config, run_ids, seed=None):
+        return [RunResult.load(self.run_path(config, run_id, seed)) for run_id in run_ids if self.has(config, run_id, seed)]
+
+    def configs(self):
+        configs = []
+        for name in sorted(os.listdir(self.directory)):
+            config_path = os.path.join(self.directory, name, "config.json")
+            if os.path.exists(config_path):
+                with open(config_path) as config_file:
+                    configs.append(json.load(config_file))
+        return configs
+
+    def query(self, seed=None, **filters):
+        """The stored runs whose configuration matches every filter, e.g. query(num_banks=10), optionally of one batch seed."""
+        return ResultQuery(self, filters, seed)
+
+    def batch(self, config, seed, run_ids):
+        """The stored runs run_ids of the batch seeded with seed, of exactly config rather than every config it matches."""
+        return ResultQuery(self, {}, seed, config, run_ids)
+
+class ResultQuery:
+    """A lazy selection of stored runs.
+
+    Nothing is read until it is iterated or aggregated, and aggregates stream
+    the run files one at a time, so a query over thousands of runs needs the
+    memory of one run plus the running statistics.
+    """
+    def __init__(self, store, filters, seed=None, config=None, run_ids=None):
+        self.store = store
+        self.filters = filters
+        self.seed = seed
+        self.config = config
+        self.run_ids = None if run_ids is None else set(run_ids)
+
+    def configs(self):
+        if self.config is not None:
+            return [self.config] if os.path.isdir(self.store.config_dir(self.config)) else []
+        return [config for config in self.store.configs()
+            if all(config.get(name) == value for name, value in self.filters.items())]
+
+    def paths(self, config):
+        # only finished runs, not the checkpoints, tapes or part-written files sharing the directory
+        config_dir = self.store.config_dir(config)
+        runs = [(int(match.group(1)), name) for name, match in ((name, RUN_FILE.match(name)) for name in os.listdir(config_dir))
+            if match and (self.seed is None or match.group(2) == str(self.seed)) and (self.run_ids is None or int(match.group(1)) in self.run_ids)]
+        return [os.path.join(config_dir, name) for run_id, name in sorted(runs)]
+
+    def results(self, config):
+        for path in self.paths(config):
+            yield RunResult.load(path)
+
+    def __iter__(self):
+        for config in self.configs():
+            yield from self.results(config)
+
+    def __len__(self):
+        return sum(len(self.paths(config)) for config in self.configs())
+
+    def trackers(self):
+        """(config, ConvergenceTracker) for each configuration, folded over its runs."""
+        for config in self.configs():
+            tracker = ConvergenceTracker()
+            for result in self.results(config):
+                tracker.add(result)
+            if tracker.n:
+                yield config, tracker
+
+    def means(self):
+        """Per-step mean of every metric across runs, as one DataFrame per configuration key."""
+        return {config_key(config): pd.DataFrame(tracker.mean, columns=tracker.columns) for config, tracker in self.trackers()}
+
+    def correlations(self):
+        """Spread correlations of the cross-run mean series, with the run-level confidence interval, one row per configuration."""
+        rows = []
+        for config, tracker in self.trackers():
+            row = dict(config, runs=tracker.n)
+            interval = tracker.confidence_interval()
+            for i, (name, correlation) in enumerate(zip(ACTIVITY_COLUMNS, tracker.correlations())):
+                row[name] = correlation
+                row[name + " Low"] = np.nan if interval is None else interval[0][i]
+                row[name + " High"] = np.nan if interval is None else interval[1][i]
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def runs(self):
+        """One row per run with its configuration, summary and metadata, read from the file headers only."""
+        rows = []
+        for config in self.configs():
+            for path in self.paths(config):
+                with np.load(path) as arrays:
+                    header = json.loads(str(arrays["header"]))
+                row = dict(config, run_id=header["run_id"])
+                row.update({name: value for name, value in header["summary"].items() if not isinstance(value, (list, dict))})
+                row.update({"metadata " + name: json.dumps(value) for name, value in (header.get("metadata") or {}).items()})
+                rows.append(row)
+        return pd.DataFrame(rows)
+
+    def balances(self):
+        """Final (bank_eur, bank_usd, trader_eur, trader_usd) pooled over every selected run."""
+        columns = ([], [], [], [])
+        for result in self:
+            for column, values in zip(columns, (result.bank_eur, result.bank_usd, result.trader_eur, result.trader_usd)):
+                column.append(values)
+        return tuple(np.concatenate(column) if column else np.zeros(0) for column in columns)
@@ -0,0 +1,33 @@
+import numpy as np
+
+def seed_sequence(seed=None, run_id=None):
+    """The SeedSequence for one run. Run i of a batch gets child stream i of the batch seed."""
+    if run_id is None:
+        return np.random.SeedSequence(seed)
+    return np.random.SeedSequence(seed, spawn_key=(run_id,))
+
+class RandomBlocks:
+    """Scalar draws for agent hot paths, served from blocks pre-drawn from a model's Generator."""
+    def __init__(self, generator, block_size=4096):
+        self.generator = generator
+        self.block_size = block_size
+        self.uniforms = generator.random(block_size)
+        self.normals = generator.standard_normal(block_size)
+        self.next_uniform = 0
+        self.next_normal = 0
+
+    def uniform(self):
+        if self.next_uniform == self.block_size:
+            self.uniforms = self.generator.random(self.block_size)
+            self.next_uniform = 0
+        value = self.uniforms[self.next_uniform]
+        self.next_uniform += 1
+        return value
+
+    def normal(self, mean=0.0, std=1.0):
+        if self.next_normal == self.block_size:
+            self.normals = self.generator.standard_normal(self.block_size)
+            self.next_normal = 0
+        value = self.normals[self.next_normal]
+        self.next_normal += 1
+        return mean + std * value
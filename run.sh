@@ -1,6 +1,10 @@
 #!/bin/bash
 
-while getopts b:t:n:d:r: flag
+population=""
+seed=""
+pairs=""
+warm=""
+while getopts b:t:n:d:r:s:px:w:u: flag
 do
     case "${flag}" in
         b) banks=${OPTARG};;
@@ -8,8 +12,13 @@ do
         n) runs=${OPTARG};;
         d) training_data=${OPTARG};;
         r) running_data=${OPTARG};;
+        s) seed="-s ${OPTARG}";;
+        p) population="-p";;
+        x) pairs="$pairs --pair ${OPTARG}";;
+        w) warm="$warm --warm-start ${OPTARG}";;
+        u) warm="$warm --warm-up ${OPTARG}";;
     esac
 done
 
 source env/bin/activate
-python3 test.py -b $banks -t $traders -n $runs -d $training_data -r $running_data
+python3 test.py -b $banks -t $traders -n $runs -d $training_data -r $running_data $seed $population $pairs $warm
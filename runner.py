@@ -0,0 +1,169 @@
+from dataclasses import dataclass, field
+from typing import List, Tuple
+from multiprocessing import Pool, cpu_count
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from checkpoint import load_checkpoint, read_checkpoint_header, save_checkpoint
+from model import FXModel
+from profiling import StepProfiler
+from rng import seed_sequence
+from tape import TradeTape
+
+@dataclass
+class RunSpec:
+    """Everything a worker needs to build one FXModel locally."""
+    run_id: int
+    num_banks: int
+    num_traders: int
+    linear_params: Tuple[float, float]
+    running_data: object # csv path or a SharedMarketData
+    population: bool = False
+    seed: int = None # batch seed, the run draws from child stream run_id of it
+    config: dict = None # caller's description of the run, carried through to the RunResult
+    checkpoint_every: int = 0 # steps between checkpoints, 0 for none
+    checkpoint_dir: str = None
+    warm_start: str = None # checkpoint of a shared warm-up to continue from on this run's own random stream
+    profile: bool = False # time each phase of the step, see profiling.StepProfiler
+    metadata: dict = None # caller's provenance for the run, such as dataset fingerprints, carried through to the RunResult
+    tape_dir: str = None # record every trade to a tape.TradeTape in this directory
+
+    def build(self):
+        """The model for this run: resumed from its own checkpoint, forked from the warm-up, or new."""
+        checkpoint_path = self.checkpoint_path()
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            if not self.saved(checkpoint_path):
+                raise ValueError("Checkpoint " + checkpoint_path + " was saved by a run with other settings or another seed, remove it to start over")
+            return load_checkpoint(checkpoint_path, self.running_data)
+        if self.warm_start is not None:
+            header = read_checkpoint_header(self.warm_start)
+            if [header["num_banks"], header["num_traders"], header["population"]] != [self.num_banks, self.num_traders, self.population]:
+                raise ValueError("Warm-up " + self.warm_start + " was saved by a model with other settings")
+            return load_checkpoint(self.warm_start, self.running_data, seed_sequence(self.seed, self.run_id), self.linear_params)
+        return FXModel(self.num_banks, self.num_traders, self.linear_params, self.running_data, self.population,
+            seed_sequence(self.seed, self.run_id))
+
+    def saved(self, checkpoint_path):
+        """Whether the checkpoint is this run's own, as load_checkpoint rebuilds the model from the header and not from the spec."""
+        header = read_checkpoint_header(checkpoint_path)
+        sequence = seed_sequence(self.seed, self.run_id)
+        return ([header["num_banks"], header["num_traders"], header["population"], header["params"], header["seed"], header["spawn_key"]] ==
+            [self.num_banks, self.num_traders, self.population, [float(param) for param in self.linear_params], sequence.entropy, list(sequence.spawn_key)])
+
+    def checkpoint_path(self):
+        if self.checkpoint_dir is None or not self.checkpoint_every:
+            return None
+        return os.path.join(self.checkpoint_dir, "run" + str(self.run_id) + "_" + str(self.seed) + ".ckpt.npz")
+
+    def tape_path(self):
+        if self.tape_dir is None:
+            return None
+        return os.path.join(self.tape_dir, "run" + str(self.run_id) + "_" + str(self.seed) + ".tape")
+
+@dataclass
+class RunResult:
+    """Compact record of a finished run, sent back to the parent instead of the model."""
+    run_id: int
+    columns: List[str]
+    metrics: np.ndarray # one row per step, one column per model reporter
+    bank_eur: np.ndarray
+    bank_usd: np.ndarray
+    trader_eur: np.ndarray
+    trader_usd: np.ndarray
+    summary: dict = field(default_factory=dict)
+    config: dict = None
+    profile: dict = None # StepProfiler.export() of the run if it was profiled
+    metadata: dict = None
+
+    @classmethod
+    def from_model(cls, run_id, model, config=None, metadata=None):
+        df = model.datacollector.get_model_vars_dataframe()
+        bank_eur, bank_usd = model.bank_balances()
+        trader_eur, trader_usd = model.trader_balances()
+        return cls(run_id, list(df.columns), df.to_numpy(dtype=np.float64), bank_eur.copy(), bank_usd.copy(),
+            trader_eur.copy(), trader_usd.copy(),
+            {"steps": model.current_step, "trades": model.num_trades, "eur_volume": float(model.eur_volume), "usd_volume": float(model.usd_volume),
+            "seed": model.seed_sequence.entropy, "spawn_key": model.seed_sequence.spawn_key,
+            "linear_params": [float(param) for param in model.params]}, config,
+            model.profiler.export() if model.profiler is not None else None, metadata)
+
+    def save(self, path):
+        """Writes the record as a single .npz, atomically so an interrupted write never looks finished."""
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, metrics=self.metrics, bank_eur=self.bank_eur, bank_usd=self.bank_usd,
+            trader_eur=self.trader_eur, trader_usd=self.trader_usd,
+            header=json.dumps({"run_id": self.run_id, "columns": self.columns, "summary": self.summary, "config": self.config,
+                "profile": self.profile, "metadata": self.metadata}))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            header = json.loads(str(arrays["header"]))
+            return cls(header["run_id"], header["columns"], arrays["metrics"], arrays["bank_eur"], arrays["bank_usd"],
+                arrays["trader_eur"], arrays["trader_usd"], header["summary"], header["config"], header.get("profile"), header.get("metadata"))
+
+    def get_model_vars_dataframe(self):
+        return pd.DataFrame(self.metrics, columns=self.columns)
+
+def warm_up(path, steps, num_banks, num_traders, linear_params, running_data, population=False, seed=None):
+    """Runs one model for steps steps on the batch seed's own stream and checkpoints it at path, for RunSpec.warm_start to fork runs from."""
+    model = FXModel(num_banks, num_traders, linear_params, running_data, population, seed_sequence(seed))
+    if not 0 < steps < model.max_steps - 1:
+        raise ValueError("A warm-up needs between 1 and " + str(model.max_steps - 2) + " steps of this data")
+    for i in range(steps):
+        model.step()
+    save_checkpoint(model, path)
+
+def run_model(spec):
+    start = time.perf_counter()
+    model = spec.build()
+    built = time.perf_counter()
+    if spec.profile:
+        model.profiler = StepProfiler()
+    tape_path = spec.tape_path()
+    if tape_path is not None:
+        os.makedirs(spec.tape_dir, exist_ok=True)
+        model.tape = TradeTape(tape_path, after_step=model.current_step) # a resumed run drops the trades after its checkpoint
+    checkpoint_path = spec.checkpoint_path()
+    if checkpoint_path is not None:
+        os.makedirs(spec.checkpoint_dir, exist_ok=True)
+    for i in range(model.current_step, model.max_steps - 1):
+        model.step()
+        if checkpoint_path is not None and model.current_step % spec.checkpoint_every == 0:
+            if model.tape is not None:
+                model.tape.flush()
+            save_checkpoint(model, checkpoint_path)
+    if model.tape is not None:
+        model.tape.close(model.ledger.index)
+    result = RunResult.from_model(spec.run_id, model, spec.config, spec.metadata)
+    if tape_path is not None:
+        result.summary["tape"] = os.path.abspath(tape_path)
+    result.summary["build_seconds"] = built - start
+    result.summary["run_seconds"] = time.perf_counter() - built
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path) # finished, nothing left to resume
+    return result
+
+def run_batch(specs, processes=None):
+    """Runs every spec on one long-lived pool, yielding results in completion order.
+
+    Workers pull the next spec as soon as they finish one, so no core waits for
+    the slowest run of a batch. Progress is a single bar with aggregate runs/s and steps/s.
+    """
+    if len(specs) == 0:
+        return
+    from tqdm import tqdm # only the parent draws progress, workers never need it
+    processes = min(processes or cpu_count(), len(specs))
+    steps = 0
+    start = time.perf_counter()
+    with Pool(processes=processes) as pool, tqdm(total=len(specs), unit="run") as pbar:
+        for result in pool.imap_unordered(run_model, specs, chunksize=1):
+            steps += result.summary["steps"]
+            pbar.set_postfix(steps_per_s="{:.0f}".format(steps / (time.perf_counter() - start)))
+            pbar.update(1)
+            yield result
+    elapsed = time.perf_counter() - start
+    print("Completed {} runs in {:.1f}s ({:.2f} runs/s, {:.0f} steps/s)".format(len(specs), elapsed, len(specs) / elapsed, steps / elapsed))
@@ -0,0 +1,85 @@
+from itertools import product
+import json
+import os
+from data import DataReader, SharedMarketData, fingerprint
+from regression import generate_linear_model_params
+from results import ResultStore
+from rng import seed_sequence
+from runner import RunSpec, run_batch
+
+SWEEP_AXES = ("num_banks", "num_traders", "training_data", "running_data")
+
+def expand_grid(grid):
+    """Every configuration of a grid such as {"num_banks": [10, 20], "num_traders": 50, ...}.
+
+    Each axis in SWEEP_AXES takes either a single value or a list of values.
+    """
+    axes = [grid[axis] if isinstance(grid[axis], (list, tuple, range)) else [grid[axis]] for axis in SWEEP_AXES]
+    return [dict(zip(SWEEP_AXES, values)) for values in product(*axes)]
+
+class SweepStore(ResultStore):
+    """A ResultStore whose runs all share one seed, kept in sweep.json so an interrupted sweep resumes on the same streams."""
+    def __init__(self, directory, seed=None):
+        super().__init__(directory)
+        meta_path = os.path.join(self.directory, "sweep.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                stored_seed = json.load(meta_file)["seed"]
+            if seed is not None and seed != stored_seed:
+                raise ValueError("Sweep store " + self.directory + " was created with seed " + str(stored_seed))
+            seed = stored_seed
+        else:
+            if seed is None:
+                seed = seed_sequence().entropy
+            with open(meta_path, "w") as meta_file:
+                json.dump({"seed": seed}, meta_file)
+        self.seed = seed # resumed runs must draw from the same streams as the ones already stored
+
+def datasets(config):
+    """Fingerprints of the data files a configuration ran on, and of the warm-up its runs were forked from."""
+    return {name: fingerprint(config[name]) for name in ("training_data", "running_data", "warm_start") if name in config and os.path.exists(config[name])}
+
+def run_sweep(grid, num_runs, store_dir, seed=None, population=False, processes=None, on_result=None, checkpoint_every=0):
+    """Runs num_runs seeds of every grid configuration on one pool, skipping runs already in the store.
+
+    Run i of every configuration uses child stream i of the sweep seed, so
+    configurations are compared on common random numbers. on_result is called
+    with every run, stored ones first, and returning True from it stops the
+    sweep without launching the remaining runs. With checkpoint_every, runs
+    also checkpoint into their configuration's directory, so an interrupted
+    sweep picks unfinished runs up where they stopped. Returns a list of
+    (config, [RunResult]) in grid order.
+    """
+    store = SweepStore(store_dir, seed)
+    configs = [dict(config, population=population) for config in expand_grid(grid)]
+    pending = [(config, run_id) for config in configs for run_id in range(num_runs) if not store.has(config, run_id)]
+    if len(pending) < len(configs) * num_runs:
+        print("Resuming sweep: " + str(len(configs) * num_runs - len(pending)) + " runs already stored, " + str(len(pending)) + " to go")
+        if on_result is not None:
+            for config in configs:
+                for result in store.load(config, range(num_runs)):
+                    if on_result(result):
+                        return [(config, store.load(config, range(num_runs))) for config in configs]
+
+    # each training set is fitted and each running set resampled once for the whole sweep
+    linear_params = {path: generate_linear_model_params(path) for path in {config["training_data"] for config, _ in pending}}
+    market_data = {}
+    try:
+        for path in {config["running_data"] for config, _ in pending}:
+            market_data[path] = SharedMarketData(DataReader(path).get_hour_data())
+        specs = [RunSpec(run_id, config["num_banks"], config["num_traders"], linear_params[config["training_data"]],
+            market_data[config["running_data"]], config["population"], store.seed, config, checkpoint_every, store.config_dir(config) if checkpoint_every else None,
+            metadata=datasets(config)) for config, run_id in pending]
+        batch = run_batch(specs, processes)
+        try:
+            for result in batch:
+                store.save(result)
+                if on_result is not None and on_result(result):
+                    print("Stopping sweep early")
+                    break
+        finally:
+            batch.close() # terminates the pool, dropping runs that haven't finished
+    finally:
+        for shared in market_data.values():
+            shared.close()
+    return [(config, store.load(config, range(num_runs))) for config in configs]
@@ -0,0 +1,52 @@
+from argparse import ArgumentParser
+import os
+import numpy as np
+import pandas as pd
+
+def generate_ticks(num_ticks, start="2021-01-04", seed=0, mean_interval_ms=2000, price=1.2, volatility=0.00003, spread=0.00012):
+    """A synthetic EURUSD tick series: a Gaussian random walk mid price with exponential tick arrivals.
+
+    Returns (dates as datetime64[ms], bids, offers).
+    """
+    rng = np.random.default_rng(seed)
+    intervals = np.maximum(rng.exponential(mean_interval_ms, num_ticks), 1).astype(np.int64)
+    dates = np.datetime64(start, "ms") + np.cumsum(intervals).astype("timedelta64[ms]")
+    mids = price + np.cumsum(rng.normal(0, volatility, num_ticks))
+    half_spreads = np.abs(rng.normal(spread, spread / 3, num_ticks)) / 2
+    return dates, np.round(mids - half_spreads, 5), np.round(mids + half_spreads, 5)
+
+def format_ticks(dates, bids, offers, file_format):
+    """HistData layouts: month files are "YYYYMMDD HHMMSSmmm,bid,offer,0", year files "YYYYMMDD HHMMSS;bid;offer;0"."""
+    stamps = pd.Series(np.datetime_as_string(dates, unit="ms"))
+    day = stamps.str.slice(0, 4) + stamps.str.slice(5, 7) + stamps.str.slice(8, 10)
+    time = stamps.str.slice(11, 13) + stamps.str.slice(14, 16) + stamps.str.slice(17, 19)
+    if file_format == "month":
+        time = time + stamps.str.slice(20, 23)
+    return pd.DataFrame({"date": day + " " + time, "bid": bids, "offer": offers, "volume": 0})
+
+def write_tick_file(path, num_ticks, file_format="month", seed=0, chunk_size=1000000, **kwargs):
+    """Writes num_ticks synthetic ticks to path in the layout DataReader expects for file_format."""
+    if file_format not in ("month", "year"):
+        raise ValueError("file_format must be 'month' or 'year'")
+    # DataReader picks the layout from the file name
+    if (file_format == "year") != ("year" in path):
+        raise ValueError("DataReader only reads " + path + " as a year file if 'year' is in its name")
+    dates, bids, offers = generate_ticks(num_ticks, seed=seed, **kwargs)
+    separator = ";" if file_format == "year" else ","
+    with open(path, "w") as output:
+        for start in range(0, num_ticks, chunk_size):
+            end = start + chunk_size
+            format_ticks(dates[start:end], bids[start:end], offers[start:end], file_format).to_csv(
+                output, sep=separator, header=False, index=False, float_format="%.5f")
+    return path
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Write a synthetic EURUSD tick file in HistData layout.")
+    parser.add_argument("-n", "--ticks", type=int, default=1000000, help= "The number of ticks to generate.")
+    parser.add_argument("-f", "--format", choices=["month", "year"], default="month", help= "The HistData layout to write.")
+    parser.add_argument("-s", "--seed", type=int, default=0, help= "Seed for the random walk.")
+    parser.add_argument("-o", "--output", help= "Path of the file to write.")
+    args = parser.parse_args()
+    output = args.output or os.path.join("data", "synthetic_" + args.format + "_" + str(args.ticks) + "_tick_data.csv")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    print("Wrote " + write_tick_file(output, args.ticks, args.format, args.seed))
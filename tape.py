@@ -0,0 +1,106 @@
+import json
+import os
+import numpy as np
+
+VENUE_CDA, VENUE_SELL_SIDE = 0, 1 # venues: a bank's CDA match, or a trader's trade at its bank's rate
+VENUES = ("CDA", "sell-side")
+
+# one executed trade: buyer bought quantity of currency (a ledger column) from seller at price
+TRADE = np.dtype([("quantity", "<f8"), ("price", "<f8"), ("step", "<i4"), ("buyer", "<i4"), ("seller", "<i4"),
+    ("pair", "u1"), ("currency", "u1"), ("venue", "u1")], align=True)
+HEADER = np.dtype([("magic", "S8"), ("record_size", "<u4"), ("version", "<u4"), ("count", "<u8")])
+MAGIC = b"FXTRADES"
+DATA_OFFSET = 64 # records start on a cache line
+
+class TradeTape:
+    """Every executed trade of one run, appended to a memory-mapped file of fixed-width TRADE records.
+
+    Off unless assigned to model.tape. Single trades from the Trader paths are
+    buffered in a list of at most buffer_size tuples, batches from the CDA and
+    TraderPopulation are copied in directly, and the record count in the header
+    is only bumped once the records are written, so a reader never sees a
+    partial record. The file grows by doubling and is trimmed on close.
+    With after_step, an existing tape is reopened keeping only the trades up
+    to that step, for a run resumed from a checkpoint.
+    """
+    def __init__(self, path, buffer_size=65536, after_step=None):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.pending = []
+        count = 0
+        if after_step is not None and os.path.exists(path):
+            count = int(np.searchsorted(read_tape(path)["step"], after_step, side="right"))
+            self.file = open(path, "r+b")
+        else:
+            self.file = open(path, "w+b")
+            self.file.truncate(DATA_OFFSET)
+        self.header = np.memmap(self.file, dtype=HEADER, mode="r+", shape=(1,))
+        self.header[0] = (MAGIC, TRADE.itemsize, 1, count)
+        self.count = count
+        self.records = None
+        self.map(max(count, buffer_size))
+
+    def map(self, capacity):
+        self.file.truncate(DATA_OFFSET + capacity * TRADE.itemsize)
+        self.records = np.memmap(self.file, dtype=TRADE, mode="r+", offset=DATA_OFFSET, shape=(capacity,))
+
+    def record(self, step, buyer, seller, currency, quantity, price, venue=VENUE_SELL_SIDE, pair=0):
+        self.pending.append((quantity, price, step, buyer, seller, pair, currency, venue))
+        if len(self.pending) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, step, buyers, sellers, currency, quantity, price, venue=VENUE_CDA, pair=0):
+        """Appends a batch of trades given as arrays, or scalars shared by the batch."""
+        block = np.empty(len(buyers), dtype=TRADE)
+        block["quantity"], block["price"], block["step"] = quantity, price, step
+        block["buyer"], block["seller"] = buyers, sellers
+        block["pair"], block["currency"], block["venue"] = pair, currency, venue
+        self.flush()
+        self.write(block)
+
+    def flush(self):
+        if self.pending:
+            block = np.array(self.pending, dtype=TRADE)
+            self.pending = []
+            self.write(block)
+
+    def write(self, block):
+        if len(block) == 0:
+            return
+        end = self.count + len(block)
+        if end > len(self.records):
+            self.records.flush()
+            self.map(max(end, 2 * len(self.records)))
+        self.records[self.count:end] = block
+        self.count = end
+        self.header["count"] = end # published after the records
+
+    def close(self, accounts=None):
+        """Writes out the last trades and trims the file. accounts, the ledger's unique_id -> account index, is saved alongside."""
+        self.flush()
+        self.records.flush()
+        self.header.flush()
+        self.records = self.header = None
+        self.file.truncate(DATA_OFFSET + self.count * TRADE.itemsize)
+        self.file.close()
+        if accounts is not None:
+            with open(self.path + ".accounts.json", "w") as accounts_file:
+                json.dump(sorted(accounts, key=accounts.get), accounts_file)
+
+def read_tape(path):
+    """The trades on a tape as a read-only structured array, columns by name e.g. read_tape(path)["quantity"].
+
+    Only the records published so far are mapped, so a tape that is still
+    being written can be read at any time.
+    """
+    header = np.fromfile(path, dtype=HEADER, count=1)[0]
+    if header["magic"] != MAGIC or header["record_size"] != TRADE.itemsize:
+        raise ValueError(path + " is not a trade tape of this version")
+    if header["count"] == 0:
+        return np.zeros(0, dtype=TRADE)
+    return np.memmap(path, dtype=TRADE, mode="r", offset=DATA_OFFSET, shape=(int(header["count"]),))
+
+def read_accounts(path):
+    """unique_id of each account number on the tape at path."""
+    with open(path + ".accounts.json") as accounts_file:
+        return json.load(accounts_file)
@@ -1,119 +1,31 @@
-from model import *
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-from multiprocessing import Pool, RLock, cpu_count
-from tqdm import tqdm
 from argparse import ArgumentParser
-from regression import generate_linear_model_params
+from headless import report_stats, run
+from results import config_key
 import os
 
-def run_model(pid, model):
-    tqdm_text = "#" + "{}".format(pid).zfill(3)
-    n = model.max_steps - 1
-    with tqdm(total=n, desc=tqdm_text, position=pid+1) as pbar:
-        for i in range(n):
-            model.step()
-            pbar.update(1)
-    return model
+def report(line):
+    print(line)
+    stats_file.write(line + '\n')
 
-def batch_run(num_banks, num_traders, num_runs, running_data, linear_params):
-    num_processes = num_runs
-    pool = Pool(processes=num_processes, initargs=(RLock(),), initializer=tqdm.set_lock)
-    print("Initialising models...")
-    models = [FXModel(num_banks, num_traders, linear_params, running_data) for i in range(num_processes)]
-    jobs = [pool.apply_async(run_model, args=(i, m)) for i, m in enumerate(models)]
-    pool.close()
-    result_list = [job.get() for job in jobs]
-    print("\n" * (len(models) + 1))
-    return result_list
-
-def batch_run_seqeuntial_batched(num_banks, num_traders, num_runs, running_data, linear_params):
-    batches = int(num_runs / cpu_count())
-    runs_left = num_runs
-    result_lists = []
-    for i in range(1, batches + 1):
-        result_list = batch_run(num_banks, num_traders, cpu_count(), running_data, linear_params)
-        result_lists.append(result_list)
-        runs_left -= len(result_list)
-        print("Runs left: " + str(runs_left))
-    
-    if runs_left > 0:
-        result_lists.append(batch_run(num_banks, num_traders, runs_left, running_data, linear_params))
-
-    results = [j for sub in result_lists for j in sub]
-    return results
-
-def display_trader_wealth(model_agents):
-    final_trader_euro_amounts = np.array([[agent.EUR for agent in agent_list if agent.unique_id.startswith("trader")] for agent_list in model_agents]).flatten()
-    final_trader_dollar_amounts = np.array([[agent.USD for agent in agent_list if agent.unique_id.startswith("trader")] for agent_list in model_agents]).flatten()
-    hist_fig, hist_axs = plt.subplots(2, sharex=True)
-    hist_fig.set_size_inches(7, 7)
-    hist_fig.text(0.5, 0.04, 'Currency Reserves', ha='center')
-    hist_fig.text(0.04, 0.5, 'Number of Agents', va='center', rotation='vertical')
-    hist_fig.suptitle("Trading Agent Currency Reserves")
-    hist_axs[0].hist(final_trader_euro_amounts, bins=100, color="green", label="Euros")
-    hist_axs[1].hist(final_trader_dollar_amounts, bins=100, color="orange",label="Dollars")
-    hist_fig.legend(loc="upper right")
-    hist_fig.savefig("./results/histogram" + str(banks) + "_" + str(traders) + "_" + str(runs) 
-        + "_" + training_path.split("/")[-1] + "_" + run_path.split("/")[-1] + ".png")
-    trader_euro_range_string = "Trader Euros Range: " + str(round(final_trader_euro_amounts.min() / 1000000)) + " million - " + str(round(final_trader_euro_amounts.max() / 1000000)) + " million"
-    trader_dollar_range_string = "Trader Dollars Range: " + str(round(final_trader_dollar_amounts.min() / 1000000)) + " million - " + str(round(final_trader_dollar_amounts.max() / 1000000)) + " million"
-    print(trader_euro_range_string)
-    print(trader_dollar_range_string)
-    stats_file.write(trader_euro_range_string + '\n' + trader_dollar_range_string + '\n')
-
-
-def main(num_banks, num_traders, num_runs, training_data, running_data):
-    linear_params = generate_linear_model_params(training_data)
-    result_list = batch_run_seqeuntial_batched(num_banks, num_traders, num_runs, running_data, linear_params)
-    model_agents = [model.schedule.agents for model in result_list]
-    
+def main(num_banks, num_traders, num_runs, training_data, running_data, population=False, seed=None, replay=None, checkpoint_every=0, profile=False, pairs=(),
+        plot=True, show=True, tape=False, warm_start=None, warm_up=0):
+    config, query = run(num_banks, num_traders, num_runs, training_data, running_data, population, seed, replay, checkpoint_every, profile, pairs,
+        report=report, tape=tape, warm_start=warm_start, warm_up_steps=warm_up)
+    bank_eur, bank_usd, trader_eur, trader_usd = report_stats(query, num_traders, report)
+    if not plot:
+        return
+    if not show:
+        import matplotlib
+        matplotlib.use("Agg") # only saving the figures, no display needed
+    # plotting is only imported once it's needed, headless runs never pay for it
+    import matplotlib.pyplot as plt
+    from plots import plot_spread_activity, plot_trader_wealth
+    name = str(banks) + "_" + str(traders) + "_" + str(runs) + "_" + training_path.split("/")[-1] + "_" + run_path.split("/")[-1] + ".png"
     if num_traders > 0:
-        display_trader_wealth(model_agents)
-
-    final_bank_euro_amounts = np.array([[agent.EUR for agent in agent_list if agent.unique_id.startswith("bank")] for agent_list in model_agents]).flatten()
-    final_bank_dollar_amounts = np.array([[agent.USD for agent in agent_list if agent.unique_id.startswith("bank")] for agent_list in model_agents]).flatten()
-    bank_euro_range_string = "Bank Euros Range: " + str(round(final_bank_euro_amounts.min() / 1000000000, 4)) + " billion - " + str(round(final_bank_euro_amounts.max() / 1000000000, 4)) + " billion"
-    bank_dollar_range_string = "Bank Dollars Range: " + str(round(final_bank_dollar_amounts.min() / 1000000000, 4)) + " billion - " + str(round(final_bank_dollar_amounts.max() / 1000000000, 4)) + " billion"    
-    stats_file.write(bank_euro_range_string + '\n' + bank_dollar_range_string + '\n')
-    print(bank_euro_range_string)
-    print(bank_dollar_range_string)
-
-    data = [model.datacollector.get_model_vars_dataframe() for model in result_list]
-    fig, axs = plt.subplots(5, sharex=True)
-    fig.set_size_inches(11, 9)
-    fig.suptitle('Spread vs Trade Activity')
-    fig.text(0.5, 0.04, 'Model Step', ha='center')
-    df = pd.concat(data)
-    df = df.groupby(df.index).mean()
-    axs[0].plot(df.index.tolist(), df['Bid'].tolist())
-    axs[0].plot(df.index.tolist(), df['Offer'].tolist())
-    axs[0].title.set_text("Bid and Offer")
-    axs[0].set_ylabel("Exchange Rate")
-    axs[1].plot(df.index.tolist(), df['Spread'].tolist())
-    axs[1].title.set_text("Spread")
-    axs[1].set_ylabel("Spread in Pips")
-    axs[2].plot(df.index.tolist(), df['Trades'].tolist())
-    axs[2].title.set_text("Trades")
-    axs[2].set_ylabel("Number of Trades")
-    axs[3].plot(df.index.tolist(), df['USD Volume'].tolist())
-    axs[3].title.set_text("USD Hourly Traded Volume")
-    axs[3].set_ylabel("Dollars")
-    axs[4].plot(df.index.tolist(), df['EUR Volume'].tolist())
-    axs[4].title.set_text("EUR Hourly Traded Volume")
-    axs[4].set_ylabel("Euros")
-    fig.savefig("./results/graphs" + str(banks) + "_" + str(traders) + "_" + str(runs) 
-        + "_" + training_path.split("/")[-1] + "_" + run_path.split("/")[-1] + ".png")
-    corr_matrix = df.corr(method="pearson")
-    spread_trades_corr = "Correlation Between Spread and Number of Trades: " + str(round(corr_matrix.iloc[3]["Spread"], 3))
-    spread_euros_corr = "Correlation Between Spread and Euro Traded Volume: " + str(round(corr_matrix.iloc[4]["Spread"], 3))
-    spread_dollars_corr = "Correlation Between Spread and Dollar Traded Volume: " + str(round(corr_matrix.iloc[5]["Spread"], 3))
-    stats_file.write(spread_trades_corr + '\n' + spread_euros_corr + '\n' + spread_dollars_corr + '\n')
-    print(spread_trades_corr)
-    print(spread_euros_corr)
-    print(spread_dollars_corr)
-    plt.show()
+        plot_trader_wealth(trader_eur, trader_usd, "./results/histogram" + name)
+    plot_spread_activity(query.means()[config_key(config)], "./results/graphs" + name)
+    if show:
+        plt.show()
 
 if __name__ == "__main__":
     parser = ArgumentParser()
@@ -123,7 +35,31 @@ if __name__ == "__main__":
         help= "The number of times to run the model. Does a concurrent batch run using all processing threads.")
     parser.add_argument("-d", "--training", help= "The relative or absolute path to the training data.")
     parser.add_argument("-r", "--running", help= "The relative or absolute path to the run time data.")
+    parser.add_argument("-s", "--seed", type=int,
+        help= "Seed for the batch. Run i uses child stream i of it, so results can be reproduced exactly.")
+    parser.add_argument("--replay", type=int, metavar="RUN_ID",
+        help= "Only run the given run id of the batch seeded with --seed, to reproduce a single run.")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="STEPS",
+        help= "Checkpoint each run every STEPS steps. Rerunning with the same --seed resumes unfinished runs.")
+    parser.add_argument("--warm-start", metavar="PATH",
+        help= "Fork every run from the warm-up checkpoint at PATH, each continuing on its own random stream. Runs the warm-up first if PATH doesn't exist.")
+    parser.add_argument("--warm-up", type=int, default=0, metavar="STEPS",
+        help= "Steps of the shared warm-up written to --warm-start, run once on the batch seed.")
+    parser.add_argument("-p", "--population", action="store_true",
+        help= "Step each bank's traders as one vectorized population instead of individual agents.")
+    parser.add_argument("--profile", action="store_true",
+        help= "Time each phase of the model step in every run and print the merged breakdown.")
+    parser.add_argument("--pair", action="append", default=[], metavar="NAME=PATH",
+        help= "Also trade this pair, e.g. GBPUSD=./data/gbpusd_tick_data.csv. Banks quote every pair, traders stay on EURUSD.")
+    parser.add_argument("--tape", action="store_true",
+        help= "Record every executed trade of each run to a memory-mapped tape next to its stored result, see tape.py.")
+    parser.add_argument("--no-plot", action="store_true", help= "Only print and save the statistics, without drawing or importing any plots.")
+    parser.add_argument("--no-show", action="store_true", help= "Save the graphs without opening a window, so batch machines don't block on it.")
     args = parser.parse_args()
+    if args.replay is not None and args.seed is None:
+        parser.error("--replay needs the --seed of the batch the run belongs to")
+    if args.warm_up and args.warm_start is None:
+        parser.error("--warm-up needs the --warm-start path to write the warm-up to")
     if not os.path.exists("./results"):
         os.makedirs("./results")
     banks, traders, runs = args.bank, args.trader, args.runs
@@ -147,5 +83,7 @@ if __name__ == "__main__":
     elif runs < 1:
         print("Must have at least 1 model run")
     else:
-        main(banks, traders, runs, training_path, run_path)
+        main(banks, traders, runs, training_path, run_path, args.population, args.seed, args.replay, args.checkpoint_every, args.profile,
+            [tuple(pair.split("=", 1)) for pair in args.pair], not args.no_plot, not args.no_show, args.tape,
+            args.warm_start, args.warm_up)
     stats_file.close()
\ No newline at end of file
@@ -1,24 +1,62 @@
-from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import ChartModule
+from argparse import ArgumentParser
+from multiprocessing import Process
+import signal
+import sys
+from data import DataReader
+from live import MetricsBuffer, run_live, serve
 
-from model import *
+def launch_mesa_server(num_banks, num_traders, training_data, running_data, seed=None, port=8521):
+    from mesa.visualization.ModularVisualization import ModularServer
+    from mesa.visualization.modules import ChartModule
+    from model import FXModel
+    from regression import generate_linear_model_params
 
-rate_chart = ChartModule([{"Label": "Bid",
-                      "Color": "Black"},
-                      {"Label": "Offer",
-                      "Color": "Red"}],
-                    data_collector_name='datacollector')
-                
-spread_chart = ChartModule([{"Label": "Spread", "Color": "Red"}], 
-                    data_collector_name='datacollector')
+    rate_chart = ChartModule([{"Label": "Bid",
+                          "Color": "Black"},
+                          {"Label": "Offer",
+                          "Color": "Red"}],
+                        data_collector_name='datacollector')
 
-trade_chart = ChartModule([{"Label": "Trades", "Color": "Blue"}], 
-                    data_collector_name='datacollector')
+    spread_chart = ChartModule([{"Label": "Spread", "Color": "Red"}],
+                        data_collector_name='datacollector')
 
-server = ModularServer(FXModel,
-                      [spread_chart, trade_chart],#  [rate_chart, spread_chart],
-                       "Foreign Exchange Model",
-                       {"NumBanks":5, "NumTraders": 100})
+    trade_chart = ChartModule([{"Label": "Trades", "Color": "Blue"}],
+                        data_collector_name='datacollector')
 
-server.port = 8521 # The default
-server.launch()
\ No newline at end of file
+    server = ModularServer(FXModel,
+                          [rate_chart, spread_chart, trade_chart],
+                           "Foreign Exchange Model",
+                           {"NumBanks": num_banks, "NumTraders": num_traders, "Linear_Model": generate_linear_model_params(training_data),
+                           "running_data_path": running_data, "seed": seed})
+
+    server.port = port
+    server.launch()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Chart a running model. Without --live or --attach this is the Mesa server, which steps the model itself.")
+    parser.add_argument("--live", action="store_true",
+        help= "Run the model at full speed in its own process and chart it live, sending only new, downsampled points.")
+    parser.add_argument("--attach", metavar="DIRECTORY",
+        help= "Chart the MetricsBuffer in DIRECTORY that a model in another process is writing to.")
+    parser.add_argument("-b", "--bank", type=int, default=5, help= "The number of banks in a model")
+    parser.add_argument("-t", "--trader", type=int, default=100, help= "The number of traders per bank in a model")
+    parser.add_argument("-d", "--training", default="none", help= "The relative or absolute path to the training data.")
+    parser.add_argument("-r", "--running", default="./data/year_2021_tick_data.csv", help= "The relative or absolute path to the run time data.")
+    parser.add_argument("-s", "--seed", type=int, help= "Seed for the model.")
+    parser.add_argument("--port", type=int, default=8521)
+    parser.add_argument("--points", type=int, default=1000, help= "Most min/max buckets to draw per series.")
+    args = parser.parse_args()
+    if args.attach:
+        serve(MetricsBuffer(args.attach), args.port, args.points)
+    elif args.live:
+        buffer = MetricsBuffer.create(DataReader(args.running).count_bars("hour"))
+        simulation = Process(target=run_live, args=(args.bank, args.trader, args.training, args.running, args.seed, buffer), daemon=True)
+        simulation.start()
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0)) # still clean up the buffer when killed
+        try:
+            serve(buffer, args.port, args.points)
+        finally:
+            simulation.terminate()
+            buffer.close()
+    else:
+        launch_mesa_server(args.bank, args.trader, args.training, args.running, args.seed, args.port)